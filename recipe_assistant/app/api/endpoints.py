@@ -1,24 +1,80 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
 from ..models.schemas import (
     QuestionRequest,
     QuestionResponse,
     FeedbackRequest,
     FeedbackResponse,
+    BulkFeedbackRequest,
+    BulkFeedbackResponse,
+    FeedbackItemResult,
+    ConversationItem,
+    ConversationPage,
 )
+import base64
+import ipaddress
+import json
 import uuid
+from datetime import datetime
+from time import time
+from typing import Optional
+
+from ..core.config import settings
+from ..core.admission import AdmissionController, AdmissionRejected
 
 from ...rag import rag
-from ...db import save_conversation, save_feedback
+from ...db import (
+    save_conversation,
+    save_feedback,
+    save_feedback_bulk,
+    get_conversations_page,
+)
 
 router = APIRouter()
 
+admission = AdmissionController(
+    max_inflight=settings.MAX_INFLIGHT_LLM_REQUESTS,
+    queue_size=settings.ADMISSION_QUEUE_SIZE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    retry_after=settings.ADMISSION_RETRY_AFTER,
+    client_rate=settings.CLIENT_RATE_LIMIT,
+    client_burst=settings.CLIENT_RATE_BURST,
+)
+
+
+trusted_proxies = [
+    ipaddress.ip_network(proxy, strict=False) for proxy in settings.TRUSTED_PROXIES
+]
+
+
+def is_trusted_proxy(host: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+
+def get_client_id(http_request: Request) -> str:
+    """client of the rate limit: its address, or the X-Client-Id set by a trusted proxy
+
+    A client could otherwise pick a new X-Client-Id for each request to get a
+    fresh rate limit bucket.
+    """
+    host = http_request.client.host if http_request.client else None
+    client_id = http_request.headers.get("X-Client-Id")
+    if client_id and is_trusted_proxy(host):
+        return client_id
+    return host or "unknown"
+
 
 @router.post("/question", response_model=QuestionResponse)
-async def handle_question(request: QuestionRequest):
+async def handle_question(request: QuestionRequest, http_request: Request):
     """answer user's query
 
     Args:
         request (QuestionRequest): user's query
+        http_request (Request): raw request, identifies the client for rate limiting
     """
 
     try:
@@ -26,15 +82,42 @@ async def handle_question(request: QuestionRequest):
         if not request.question.strip():
             raise HTTPException(status_code=400, detail="Question cannot be empty")
 
-        if request.llm_model:
-            answer = rag(request.question, request.llm_model, request.limit)
-        else:
-            answer = rag(request.question, limit=request.limit)
+        deadline_ms = request.deadline_ms or settings.DEFAULT_DEADLINE_MS
+        deadline = deadline_ms / 1000 if deadline_ms else None
+
+        arrival_time = time()
+        async with admission.admit(get_client_id(http_request)):
+            # the time spent in the queue counts against the deadline
+            if deadline is not None:
+                deadline = deadline - (time() - arrival_time)
+
+            # rag() blocks on OpenAI, it runs in the threadpool once admitted
+            if request.llm_model:
+                answer = await run_in_threadpool(
+                    rag,
+                    request.question,
+                    request.llm_model,
+                    request.limit,
+                    deadline=deadline,
+                    max_cost=request.max_cost,
+                    conversation_id=conversation_id,
+                    parent_id=request.conversation_id,
+                )
+            else:
+                answer = await run_in_threadpool(
+                    rag,
+                    request.question,
+                    limit=request.limit,
+                    deadline=deadline,
+                    conversation_id=conversation_id,
+                    parent_id=request.conversation_id,
+                )
 
         response = QuestionResponse(
             conversation_id=conversation_id,
             question=request.question,
             answer=answer["answer"],
+            fallback=answer.get("fallback"),
         )
 
         # save convsersation
@@ -46,6 +129,14 @@ async def handle_question(request: QuestionRequest):
 
         return response
 
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error processing question: {str(e)}"
@@ -69,6 +160,7 @@ async def handle_feedback(request: FeedbackRequest):
         save_feedback(
             conversation_id=conversation_id,
             feedback=feedback,
+            idempotency_key=request.idempotency_key,
         )
 
         # Create response
@@ -83,3 +175,97 @@ async def handle_feedback(request: FeedbackRequest):
         raise HTTPException(
             status_code=500, detail=f"Error processing feedback: {str(e)}"
         )
+
+
+@router.post("/feedback/bulk", response_model=BulkFeedbackResponse)
+async def handle_bulk_feedback(request: BulkFeedbackRequest):
+    """acknowledge a batch of users' feedbacks
+
+    Args:
+        request (BulkFeedbackRequest): users' feedbacks, each with an optional idempotency key
+    """
+    if any(not item.conversation_id for item in request.items):
+        raise HTTPException(status_code=400, detail="conversation_id is required")
+
+    try:
+        statuses = save_feedback_bulk(
+            [
+                (item.conversation_id, item.feedback, item.idempotency_key)
+                for item in request.items
+            ]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error processing feedback: {str(e)}"
+        )
+
+    results = [
+        FeedbackItemResult(
+            conversation_id=item.conversation_id,
+            feedback=item.feedback,
+            idempotency_key=item.idempotency_key,
+            status=status,
+        )
+        for item, status in zip(request.items, statuses)
+    ]
+    return BulkFeedbackResponse(
+        results=results,
+        created=sum(result.status == "created" for result in results),
+    )
+
+
+def encode_cursor(timestamp: datetime, conversation_id: str) -> str:
+    cursor = json.dumps({"timestamp": timestamp.isoformat(), "id": conversation_id})
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(decoded["timestamp"]), decoded["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/conversations", response_model=ConversationPage)
+async def list_conversations(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    relevance: Optional[str] = None,
+    model: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+):
+    """conversation history, newest first, paginated with an opaque cursor
+
+    Args:
+        limit (int): page size
+        cursor (Optional[str]): next_cursor of the previous page
+        relevance (Optional[str]): only this relevance
+        model (Optional[str]): only this model
+        start_time (Optional[datetime]): only conversations at or after this time
+        end_time (Optional[datetime]): only conversations before this time
+    """
+    after = decode_cursor(cursor) if cursor else None
+
+    try:
+        # one extra row tells whether there is a next page
+        rows = get_conversations_page(
+            limit=limit + 1,
+            after=after,
+            relevance=relevance,
+            model=model,
+            start_time=start_time,
+            end_time=end_time,
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error listing conversations: {str(e)}"
+        )
+
+    items = [ConversationItem(**dict(row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(items[-1].timestamp, items[-1].id)
+
+    return ConversationPage(items=items, next_cursor=next_cursor)
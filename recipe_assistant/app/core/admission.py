@@ -0,0 +1,136 @@
+# app/core/admission.py
+import asyncio
+import math
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import Optional
+
+from ... import metrics
+
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    """the request was not admitted, it should be retried after retry_after seconds"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+
+    def take(self) -> Optional[float]:
+        """take one token
+
+        Returns:
+            Optional[float]: None if a token was taken, otherwise seconds until the next token
+        """
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return None
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """caps the LLM-bound requests in flight, with a bounded wait queue and per-client rate limits"""
+
+    def __init__(
+        self,
+        max_inflight: int,
+        queue_size: int,
+        queue_timeout: float,
+        retry_after: int = 1,
+        client_rate: float = 0,
+        client_burst: int = 10,
+    ):
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self._waiting = 0
+        self._inflight = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check_rate(self, client_id: str) -> None:
+        """apply the client's token bucket
+
+        Raises:
+            AdmissionRejected: 429 when the client is over its rate
+        """
+        if self.client_rate <= 0:
+            return
+
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(self.client_rate, self.client_burst)
+            self._buckets[client_id] = bucket
+            if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(client_id)
+
+        wait_time = bucket.take()
+        if wait_time is not None:
+            metrics.increment("admission_rejected_rate_limited")
+            raise AdmissionRejected(
+                429, "Too many requests from this client", math.ceil(wait_time)
+            )
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("admission_queue_depth", self._waiting)
+        metrics.set_gauge("admission_inflight", self._inflight)
+
+    @asynccontextmanager
+    async def admit(self, client_id: str):
+        """wait for an LLM slot
+
+        Args:
+            client_id (str): client identifier for the rate limit
+
+        Raises:
+            AdmissionRejected: 429 when the client is over its rate, 503 when the queue is full or the wait times out
+        """
+        self.check_rate(client_id)
+
+        if self._semaphore.locked() and self._waiting >= self.queue_size:
+            metrics.increment("admission_rejected_queue_full")
+            raise AdmissionRejected(503, "Server is saturated", self.retry_after)
+
+        self._waiting += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(
+                self._semaphore.acquire(), timeout=self.queue_timeout
+            )
+        except asyncio.TimeoutError:
+            metrics.increment("admission_rejected_queue_timeout")
+            raise AdmissionRejected(503, "Timed out waiting in queue", self.retry_after)
+        finally:
+            self._waiting -= 1
+            self._update_gauges()
+
+        metrics.increment("admission_admitted")
+        self._inflight += 1
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            self._semaphore.release()
+            self._update_gauges()
@@ -1,6 +1,6 @@
 # app/core/config.py
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -18,6 +18,39 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     QDRANT_URL: str
 
+    # Create the tables and index the recipes on startup
+    INIT_ON_STARTUP: bool = True
+
+    # Latency budget of /question when the request has no deadline_ms
+    DEFAULT_DEADLINE_MS: Optional[int] = 20000
+
+    # Admission control of the LLM-bound requests
+    MAX_INFLIGHT_LLM_REQUESTS: int = 16
+    ADMISSION_QUEUE_SIZE: int = 64
+    ADMISSION_QUEUE_TIMEOUT: float = 5.0  # seconds
+    ADMISSION_RETRY_AFTER: int = 2  # seconds
+    CLIENT_RATE_LIMIT: float = 0  # requests per second per client, 0 disables it
+    CLIENT_RATE_BURST: int = 10
+    # addresses or networks of the proxies whose X-Client-Id header is trusted,
+    # other clients are identified by their address
+    TRUSTED_PROXIES: List[str] = []
+
+    # Cache warm-up on startup
+    WARMUP_ON_STARTUP: bool = False
+    WARMUP_SOURCE: str = "csv"  # "csv" or "conversations"
+    WARMUP_TOP_N: Optional[int] = 100  # every question is an LLM call
+    WARMUP_CONCURRENCY: int = 4
+    WARMUP_LLM_MODEL: str = "gpt-4o-mini"
+    # backoff of the model warm-up retries, /ready waits for it to succeed
+    WARMUP_RETRY_DELAY: float = 1.0  # seconds
+    WARMUP_MAX_RETRY_DELAY: float = 60.0  # seconds
+
+    # On-demand profiling of /question (/debug/profile), off unless enabled
+    PROFILING_ENABLED: bool = False
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5
+    PROFILE_OUTPUT_DIR: str = "data/profiles"
+    PROFILE_TOKEN: Optional[str] = None  # required X-Profile-Token header, if set
+
     # Environment
     ENVIRONMENT: str = "development"
     DEBUG: bool = True
@@ -0,0 +1,168 @@
+# app/core/profiling.py
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ... import metrics
+
+
+class StackSampler:
+    """samples the Python stacks of every thread at a fixed interval
+
+    The event loop (response serialization) and the executors rag() hands work
+    to (searches, hedged LLM calls) run on other threads than rag() itself, so
+    all of them are sampled, each stack rooted at its thread name. Threads
+    waiting for work are skipped. Other requests in flight show up too.
+
+    The stacks are folded ("root;caller;callee count" lines), the input of
+    flamegraph.pl, speedscope and most flamegraph viewers.
+    """
+
+    # innermost frames of a thread waiting for work: pool workers, the event loop
+    IDLE_FRAMES = {
+        ("thread.py", "_worker"),
+        ("queue.py", "get"),
+        ("selectors.py", "select"),
+    }
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _is_idle(self, frame) -> bool:
+        # a blocking queue.get() waits in threading.Condition.wait
+        for _ in range(2):
+            if frame is None:
+                return False
+            key = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+            if key in self.IDLE_FRAMES:
+                return True
+            if key != ("threading.py", "wait"):
+                return False
+            frame = frame.f_back
+        return False
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            # pool threads are numbered, e.g. ThreadPoolExecutor-0_3: one root per pool
+            names = {
+                thread.ident: re.sub(r"_\d+$", "", thread.name)
+                for thread in threading.enumerate()
+            }
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self._thread.ident or self._is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class RequestProfiler:
+    """profiles the next N requests, or the requests that ask for it
+
+    Only created when PROFILING_ENABLED is set, the endpoints skip it otherwise.
+    """
+
+    def __init__(self, output_dir: str, interval: float, token: Optional[str] = None):
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self.token = token
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return self.token is None or token == self.token
+
+    def arm(self, requests: int) -> int:
+        """profile the next requests
+
+        Args:
+            requests (int): number of requests to profile, 0 disarms
+
+        Returns:
+            int: requests left to profile
+        """
+        with self._lock:
+            self.pending = requests
+            return self.pending
+
+    def should_profile(self, requested: bool = False) -> bool:
+        """whether to profile this request, counting it against the armed ones
+
+        Args:
+            requested (bool, optional): the request asked to be profiled. Defaults to False.
+        """
+        if requested:
+            return True
+        with self._lock:
+            if self.pending > 0:
+                self.pending -= 1
+                return True
+        return False
+
+    def start(self) -> StackSampler:
+        """start sampling every thread, until stop()"""
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        return sampler
+
+    def stop(self, sampler: StackSampler, name: str, elapsed: float) -> Path:
+        """stop sampling and save the profile
+
+        Args:
+            sampler (StackSampler): sampler returned by start()
+            name (str): profile name, e.g. the request id
+            elapsed (float): seconds profiled
+
+        Returns:
+            Path: path of the folded stacks
+        """
+        return self.save(name, sampler.stop(), elapsed)
+
+    def save(self, name: str, stacks: Counter, elapsed: float) -> Path:
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = self.output_dir / f"{timestamp}-{name}.folded"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        metrics.increment("profiles_saved")
+        print(f"Profile of {name} saved to {path} ({elapsed * 1000:.0f} ms sampled)")
+        return path
+
+    def list_profiles(self) -> List[Dict[str, object]]:
+        if not self.output_dir.exists():
+            return []
+        return [
+            {"name": path.stem, "size": path.stat().st_size}
+            for path in sorted(self.output_dir.glob("*.folded"), reverse=True)
+        ]
+
+    def read_profile(self, name: str) -> Optional[str]:
+        path = self.output_dir / f"{name}.folded"
+        # names come from the url, only plain file names are served
+        if path.parent != self.output_dir or not path.exists():
+            return None
+        return path.read_text()
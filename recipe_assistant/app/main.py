@@ -1,9 +1,18 @@
 # app/main.py
-from fastapi import FastAPI
+import asyncio
+import uuid
+from time import perf_counter
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from .api.endpoints import router
 from .core.config import settings
+from .core.profiling import RequestProfiler
 from ..rag import init_qdrant
 from ..db import init_db
+from ..warmup import load_questions, warm_models, warm_up
+from .. import metrics
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -13,11 +22,56 @@ app = FastAPI(
 
 app.include_router(router, prefix="/api/v1")
 
+# /ready reports ready only once the warm-up has finished
+app.state.ready = False
+# last failure of the model warm-up while it is retried, reported by /health
+app.state.warmup_error = None
+
+
+async def warm_up_instance(questions):
+    # the instance cannot serve without its models: retry until they load
+    delay = settings.WARMUP_RETRY_DELAY
+    while True:
+        try:
+            await run_in_threadpool(warm_models)
+            break
+        except Exception as e:
+            app.state.warmup_error = str(e)
+            print(f"Model warm-up failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.WARMUP_MAX_RETRY_DELAY)
+    app.state.warmup_error = None
+
+    # the questions loaded, failing to answer some of them only costs latency
+    if questions:
+        try:
+            await run_in_threadpool(
+                warm_up,
+                questions,
+                llm_model=settings.WARMUP_LLM_MODEL,
+                concurrency=settings.WARMUP_CONCURRENCY,
+            )
+        except Exception as e:
+            print(f"Cache warm-up failed: {e}")
+    app.state.ready = True
+
 
 @app.on_event("startup")
 async def startup_event():
-    init_db()
-    init_qdrant()
+    # read the warm-up questions first: init_db() recreates the conversations table.
+    # An enabled warm-up without questions is a misconfiguration, the app does not start
+    questions = []
+    if settings.WARMUP_ON_STARTUP:
+        questions = load_questions(settings.WARMUP_SOURCE, settings.WARMUP_TOP_N)
+
+    # a pre-forked worker (see serve.py) leaves the init to its parent
+    if settings.INIT_ON_STARTUP:
+        init_db()
+        init_qdrant()
+
+    # warm the models (and pre-answer the known questions) in the background,
+    # /health answers meanwhile while /ready waits for it
+    app.state.warmup_task = asyncio.create_task(warm_up_instance(questions))
 
 
 @app.get("/")
@@ -27,7 +81,22 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    health = {"status": "healthy", "ready": app.state.ready}
+    if app.state.warmup_error is not None:
+        health["warmup_error"] = app.state.warmup_error
+    return health
+
+
+@app.get("/ready")
+async def readiness_check():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    return {"status": "ready"}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
 
 
 # Add a debug endpoint to see all routes
@@ -45,6 +114,66 @@ async def debug_routes():
     return {"routes": routes}
 
 
+# None when profiling is disabled, so requests do not pay for it
+profiler = (
+    RequestProfiler(
+        settings.PROFILE_OUTPUT_DIR,
+        settings.PROFILE_SAMPLE_INTERVAL_MS / 1000,
+        settings.PROFILE_TOKEN,
+    )
+    if settings.PROFILING_ENABLED
+    else None
+)
+
+# profiling endpoints only exist when PROFILING_ENABLED is set
+if profiler is not None:
+
+    @app.middleware("http")
+    async def profile_questions(request: Request, call_next):
+        """sample the whole /question request, response serialization included"""
+        if request.url.path != f"{settings.API_V1_STR}/question" or not (
+            profiler.should_profile(
+                request.headers.get("X-Profile") == "1"
+                and profiler.authorized(request.headers.get("X-Profile-Token"))
+            )
+        ):
+            return await call_next(request)
+
+        sampler = profiler.start()
+        start_time = perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            profiler.stop(sampler, uuid.uuid4().hex[:12], perf_counter() - start_time)
+
+    def check_profile_token(token: Optional[str]) -> None:
+        if not profiler.authorized(token):
+            raise HTTPException(status_code=403, detail="Invalid profile token")
+
+    @app.post("/debug/profile")
+    async def arm_profile(
+        requests: int = Query(1, ge=0, le=1000),
+        x_profile_token: Optional[str] = Header(None),
+    ):
+        """profile the next /question requests, 0 disarms"""
+        check_profile_token(x_profile_token)
+        return {"pending": profiler.arm(requests)}
+
+    @app.get("/debug/profile")
+    async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+        check_profile_token(x_profile_token)
+        return {"pending": profiler.pending, "profiles": profiler.list_profiles()}
+
+    @app.get("/debug/profile/{name}", response_class=PlainTextResponse)
+    async def get_profile(name: str, x_profile_token: Optional[str] = Header(None)):
+        """folded stacks of a profile, e.g. for flamegraph.pl or speedscope"""
+        check_profile_token(x_profile_token)
+        profile = profiler.read_profile(name)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return profile
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,25 +1,80 @@
 # app/models/schemas.py
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
 
 
 class QuestionRequest(BaseModel):
     question: str
+    # "auto" lets the model cascade pick the model
     llm_model: Optional[str] = None
     limit: Optional[int] = 5
+    # latency budget, at most 2 minutes
+    deadline_ms: Optional[int] = Field(default=None, gt=0, le=120000)
+    # generation budget in dollars of an "auto" request
+    max_cost: Optional[float] = None
+    # set for a follow-up: conversation_id of the previous answer
+    conversation_id: Optional[str] = None
+
+
+class RecipeSummary(BaseModel):
+    recipe_name: str
+    recipe_link: str
+    ready_in: str
 
 
 class QuestionResponse(BaseModel):
     conversation_id: str
     question: str
     answer: str
+    # set when the answer could not be generated within the deadline
+    fallback: Optional[List[RecipeSummary]] = None
 
 
 class FeedbackRequest(BaseModel):
     conversation_id: str
     feedback: int
+    # retries with the same key are only counted once
+    idempotency_key: Optional[str] = None
 
 
 class FeedbackResponse(BaseModel):
     conversation_id: str
     feedback: int
+
+
+class BulkFeedbackRequest(BaseModel):
+    items: List[FeedbackRequest] = Field(min_length=1, max_length=1000)
+
+
+class FeedbackItemResult(BaseModel):
+    conversation_id: str
+    feedback: int
+    idempotency_key: Optional[str] = None
+    status: str  # "created", "duplicate" or "unknown_conversation"
+
+
+class BulkFeedbackResponse(BaseModel):
+    results: List[FeedbackItemResult]
+    created: int
+
+
+class ConversationItem(BaseModel):
+    id: str
+    question: str
+    answer: str
+    model_used: str
+    response_time: float
+    relevance: str
+    relevance_explanation: str
+    openai_cost: Optional[float] = None
+    routing_decision: str
+    timestamp: datetime
+    thumbs_up: int
+    thumbs_down: int
+
+
+class ConversationPage(BaseModel):
+    items: List[ConversationItem]
+    # pass it as cursor to get the next page, None on the last page
+    next_cursor: Optional[str] = None
@@ -0,0 +1,323 @@
+import argparse
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import numpy as np
+import pandas as pd
+from qdrant_client import models
+
+from .. import clients, embeddings, ingest, rag
+
+GROUND_TRUTH_PATH = ingest.QUESTIONS_PATH
+DENSE_DIM = 512
+# rough token count of english text, without pulling a tokenizer in
+CHARS_PER_TOKEN = 4
+
+
+def hit_rate_mrr(
+    result_ids: np.ndarray, expected_ids: np.ndarray
+) -> Tuple[float, float]:
+    """hit rate and mrr of ranked results
+
+    Args:
+        result_ids (np.ndarray): (questions, limit) recipe ids ranked per question, -1 for missing results
+        expected_ids (np.ndarray): (questions,) relevant recipe id per question
+
+    Returns:
+        Tuple[float, float]: hit rate, mrr
+    """
+    relevance = result_ids == expected_ids[:, None]
+    ranks = np.arange(1, result_ids.shape[1] + 1)
+    hit_rate = relevance.any(axis=1).mean()
+    mrr = (relevance / ranks).sum(axis=1).mean()
+    return float(hit_rate), float(mrr)
+
+
+def load_ground_truth(path: Path = GROUND_TRUTH_PATH) -> pd.DataFrame:
+    return pd.read_csv(path)
+
+
+def embed_queries(
+    questions: List[str],
+) -> Tuple[List[List[float]], List[models.SparseVector]]:
+    return (
+        [embeddings.dense_query_vector(q) for q in questions],
+        [embeddings.sparse_query_vector(q) for q in questions],
+    )
+
+
+def synthetic_batches(
+    points: List[models.PointStruct],
+    scale: int,
+    batch_size: int = ingest.UPSERT_BATCH_SIZE,
+    noise: float = 0.05,
+    seed: int = 42,
+) -> Iterator[List[models.PointStruct]]:
+    """scale the corpus up with perturbed copies of the real recipes
+
+    Each synthetic point is a real recipe's dense vector plus gaussian noise, with
+    half of its sparse terms dropped. Its payload points to no real recipe, so it
+    only ever lowers the quality metrics. The points are generated one batch at a
+    time, so only a batch of them is ever held in memory.
+
+    Args:
+        points (List[models.PointStruct]): the real recipe points
+        scale (int): total number of points, real ones included
+        batch_size (int, optional): points per batch. Defaults to UPSERT_BATCH_SIZE.
+        noise (float, optional): standard deviation of the dense noise. Defaults to 0.05.
+        seed (int, optional): random seed. Defaults to 42.
+
+    Yields:
+        List[models.PointStruct]: the next batch of synthetic points
+    """
+    rng = np.random.default_rng(seed)
+    dense = np.array([p.vector["jina-small"] for p in points], dtype=np.float32)
+    sparse = [
+        (np.array(p.vector["bm25"].indices), np.array(p.vector["bm25"].values))
+        for p in points
+    ]
+
+    for start in range(len(points), scale, batch_size):
+        point_ids = range(start, min(start + batch_size, scale))
+        sources = rng.integers(len(points), size=len(point_ids))
+        vectors = dense[sources] + rng.normal(
+            0, noise, (len(point_ids), DENSE_DIM)
+        ).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        batch = []
+        for point_id, source, vector in zip(point_ids, sources, vectors):
+            indices, values = sparse[source]
+            keep = rng.random(len(indices)) < 0.5
+            batch.append(
+                models.PointStruct(
+                    id=point_id,
+                    vector={
+                        "jina-small": vector.tolist(),
+                        "bm25": models.SparseVector(
+                            indices=indices[keep].tolist(),
+                            values=values[keep].tolist(),
+                        ),
+                    },
+                    payload={"recipe_id": -1, "text": points[source].payload["text"]},
+                )
+            )
+        yield batch
+
+
+def estimated_memory_mb(profile: Dict, points: int) -> Dict[str, float]:
+    """model estimate of the RAM and disk footprint of the dense vectors and their HNSW graph
+
+    Computed from the vector count, the storage of the profile and the HNSW links,
+    to compare with the memory measured by qdrant_memory_mb().
+    """
+    original = points * DENSE_DIM * 4
+    quantized = {"scalar": points * DENSE_DIM, "binary": points * DENSE_DIM / 8}.get(
+        profile["quantization"], 0
+    )
+    hnsw_links = points * profile["hnsw_m"] * 2 * 4
+
+    ram = quantized + hnsw_links + (0 if profile["on_disk_vectors"] else original)
+    disk = original if profile["on_disk_vectors"] else 0
+    return {"est_ram_mb": ram / 2**20, "est_disk_mb": disk / 2**20}
+
+
+def metric_value(metrics_text: str, name: str) -> Optional[float]:
+    """value of an unlabelled metric in the Prometheus text format"""
+    for line in metrics_text.splitlines():
+        metric, _, value = line.partition(" ")
+        if metric == name:
+            return float(value)
+    return None
+
+
+def qdrant_memory_mb() -> Optional[float]:
+    """resident memory of the Qdrant server, from its /metrics endpoint
+
+    Returns:
+        Optional[float]: resident memory in MB, None when the server does not report it
+    """
+    try:
+        response = httpx.get(f"{clients.QDRANT_URL}/metrics", timeout=10)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"Could not read the Qdrant metrics: {e}")
+        return None
+    resident = metric_value(response.text, "memory_resident_bytes")
+    return None if resident is None else resident / 2**20
+
+
+def wait_for_indexing(collection_name: str, timeout: float = 600) -> None:
+    qdrant_client = clients.get_qdrant_client()
+    start_time = perf_counter()
+    while perf_counter() - start_time < timeout:
+        if (
+            qdrant_client.get_collection(collection_name).status
+            == models.CollectionStatus.GREEN
+        ):
+            return
+        sleep(1)
+
+
+def benchmark_profile(
+    profile_name: str,
+    points: List[models.PointStruct],
+    scale: int,
+    ground_truth: pd.DataFrame,
+    query_vectors: Tuple[List[List[float]], List[models.SparseVector]],
+    limit: int = 10,
+) -> Dict[str, float]:
+    """index the points, scaled up, with a collection profile and measure the hybrid search
+
+    The memory of the collection is the growth of the resident memory of Qdrant
+    from before its creation to after the searches, which paged in the vectors
+    they read. Memory freed by the previous profile may be reused, run one
+    profile per Qdrant restart for exact numbers.
+
+    Returns:
+        Dict[str, float]: measured and estimated memory, latency percentiles, hit rate and mrr
+    """
+    profile = ingest.get_collection_profile(profile_name)
+    collection_name = f"bench-{profile_name}"
+    qdrant_client = clients.get_qdrant_client()
+
+    if qdrant_client.collection_exists(collection_name):
+        qdrant_client.delete_collection(collection_name)
+    memory_before = qdrant_memory_mb()
+    ingest.create_qdrant_collection(collection_name, profile)
+    ingest.upsert_points(points, collection_name)
+    for batch in synthetic_batches(points, scale):
+        ingest.upsert_points(batch, collection_name)
+    wait_for_indexing(collection_name)
+
+    params = ingest.search_params(profile)
+    latencies = []
+    result_ids = np.full((len(ground_truth), limit), -1)
+    for i, (dense, sparse) in enumerate(zip(*query_vectors)):
+        start_time = perf_counter()
+        results = rag.rrf_query_points(dense, sparse, collection_name, limit, params)
+        latencies.append(perf_counter() - start_time)
+        ids = [point.payload["recipe_id"] for point in results]
+        result_ids[i, : len(ids)] = ids
+
+    memory_after = qdrant_memory_mb()
+    hit_rate, mrr = hit_rate_mrr(result_ids, ground_truth["id"].to_numpy())
+    qdrant_client.delete_collection(collection_name)
+
+    total_points = max(scale, len(points))
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "profile": profile_name,
+        "points": total_points,
+        "ram_mb": (
+            memory_after - memory_before
+            if memory_before is not None and memory_after is not None
+            else None
+        ),
+        **estimated_memory_mb(profile, total_points),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "hit_rate": hit_rate,
+        "mrr": mrr,
+    }
+
+
+def benchmark_index_mode(
+    mode: str,
+    ground_truth: pd.DataFrame,
+    query_vectors: Tuple[List[List[float]], List[models.SparseVector]],
+    limit: int = 5,
+) -> Dict[str, float]:
+    """index the recipes whole or chunked and measure the search and its prompts
+
+    Returns:
+        Dict[str, float]: points, latency percentiles, hit rate, mrr and mean prompt tokens
+    """
+    collection_name = f"bench-{mode}"
+    qdrant_client = clients.get_qdrant_client()
+    points = ingest.build_points(ingest.prepare_index_documents(mode))
+
+    if qdrant_client.collection_exists(collection_name):
+        qdrant_client.delete_collection(collection_name)
+    ingest.create_qdrant_collection(collection_name)
+    ingest.upsert_points(points, collection_name)
+    wait_for_indexing(collection_name)
+
+    latencies = []
+    prompt_tokens = []
+    result_ids = np.full((len(ground_truth), limit), -1)
+    for i, (question, dense, sparse) in enumerate(
+        zip(ground_truth["question"], *query_vectors)
+    ):
+        start_time = perf_counter()
+        if mode == "chunked":
+            results = rag.chunk_query_groups(
+                dense, sparse, collection_name, limit, rag.SEARCH_PARAMS
+            )
+        else:
+            results = [
+                point.payload
+                for point in rag.rrf_query_points(
+                    dense, sparse, collection_name, limit, rag.SEARCH_PARAMS
+                )
+            ]
+        latencies.append(perf_counter() - start_time)
+        ids = [result["recipe_id"] for result in results]
+        result_ids[i, : len(ids)] = ids
+        prompt_tokens.append(len(rag.build_prompt(question, results)) / CHARS_PER_TOKEN)
+
+    hit_rate, mrr = hit_rate_mrr(result_ids, ground_truth["id"].to_numpy())
+    qdrant_client.delete_collection(collection_name)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "mode": mode,
+        "points": len(points),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "hit_rate": hit_rate,
+        "mrr": mrr,
+        "prompt_tokens": float(np.mean(prompt_tokens)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Memory, latency and MRR of the collection profiles"
+    )
+    parser.add_argument(
+        "--profiles", nargs="+", default=list(ingest.COLLECTION_PROFILES)
+    )
+    parser.add_argument("--scale", type=int, default=100000, help="total points")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument(
+        "--compare-chunking",
+        action="store_true",
+        help="compare the whole-recipe and chunked indexes instead of the profiles",
+    )
+    parser.add_argument("--output", default=None, help="optional csv output")
+    args = parser.parse_args()
+
+    ground_truth = load_ground_truth()
+    query_vectors = embed_queries(ground_truth["question"].tolist())
+
+    if args.compare_chunking:
+        rows = [
+            benchmark_index_mode(mode, ground_truth, query_vectors, args.limit)
+            for mode in ["recipe", "chunked"]
+        ]
+    else:
+        points = ingest.build_points(ingest.prepare_recipe_documents())
+        rows = [
+            benchmark_profile(
+                name, points, args.scale, ground_truth, query_vectors, args.limit
+            )
+            for name in args.profiles
+        ]
+
+    df_results = pd.DataFrame(rows)
+    print(df_results.to_string(index=False, float_format="%.3f"))
+    if args.output:
+        df_results.to_csv(args.output, index=False)
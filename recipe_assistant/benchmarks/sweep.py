@@ -0,0 +1,219 @@
+import argparse
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from qdrant_client import models
+
+from .. import ingest, rag
+from .retrieval import embed_queries, hit_rate_mrr, load_ground_truth
+
+
+def search_grid(
+    multipliers: List[int], limits: List[int], fusions: List[str], modes: List[str]
+) -> List[Dict]:
+    """settings to sweep, single-branch modes only once per limit"""
+    grid = []
+    for mode, limit in itertools.product(modes, limits):
+        if mode == "hybrid":
+            for multiplier, fusion in itertools.product(multipliers, fusions):
+                grid.append(
+                    {
+                        "mode": mode,
+                        "fusion": fusion,
+                        "prefetch_multiplier": multiplier,
+                        "limit": limit,
+                    }
+                )
+        else:
+            # no prefetch nor fusion without a second branch
+            grid.append(
+                {
+                    "mode": mode,
+                    "fusion": None,
+                    "prefetch_multiplier": None,
+                    "limit": limit,
+                }
+            )
+    return grid
+
+
+def run_setting(
+    setting: Dict,
+    ground_truth: pd.DataFrame,
+    query_vectors: Tuple[List[List[float]], List[models.SparseVector]],
+    concurrency: int = 4,
+) -> Dict:
+    """run every ground truth question with one setting, concurrently
+
+    Returns:
+        Dict: the setting with its latency percentiles, hit rate and mrr
+    """
+    limit = setting["limit"]
+
+    def search(query):
+        dense, sparse = query
+        start_time = perf_counter()
+        points = rag.rrf_query_points(
+            dense,
+            sparse,
+            ingest.serving_collection_name(),
+            limit,
+            rag.SEARCH_PARAMS,
+            mode=setting["mode"],
+            fusion=setting["fusion"] or "rrf",
+            prefetch_multiplier=setting["prefetch_multiplier"] or 1,
+        )
+        return perf_counter() - start_time, [p.payload["recipe_id"] for p in points]
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        outcomes = list(executor.map(search, zip(*query_vectors)))
+
+    result_ids = np.full((len(outcomes), limit), -1)
+    for i, (_, ids) in enumerate(outcomes):
+        result_ids[i, : len(ids)] = ids
+    hit_rate, mrr = hit_rate_mrr(result_ids, ground_truth["id"].to_numpy())
+
+    latencies_ms = np.array([latency for latency, _ in outcomes]) * 1000
+    return {
+        **setting,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "hit_rate": hit_rate,
+        "mrr": mrr,
+    }
+
+
+def pareto_frontier(latencies: np.ndarray, quality: np.ndarray) -> np.ndarray:
+    """mask of the settings no other setting beats on both latency and quality
+
+    Args:
+        latencies (np.ndarray): (settings,) latency, lower is better
+        quality (np.ndarray): (settings,) quality, higher is better
+
+    Returns:
+        np.ndarray: (settings,) True on the frontier
+    """
+    no_worse = (latencies[None, :] <= latencies[:, None]) & (
+        quality[None, :] >= quality[:, None]
+    )
+    better = (latencies[None, :] < latencies[:, None]) | (
+        quality[None, :] > quality[:, None]
+    )
+    # row i is dominated when some column j is no worse everywhere and better somewhere
+    return ~(no_worse & better).any(axis=1)
+
+
+def save_search_profile(
+    name: str, setting: Dict, path: Path = rag.SEARCH_PROFILES_PATH
+) -> None:
+    """add a setting to the search profiles file read by the app's searches
+
+    Only the search settings are saved: the number of recipes retrieved is the
+    app's, pick the setting among the ones measured at that limit.
+    """
+    profiles = {}
+    if path.exists():
+        with open(path) as f:
+            profiles = json.load(f)
+
+    # single-branch settings have no fusion nor prefetch, keep the defaults
+    default = rag.SEARCH_PROFILES["default"]
+    profiles[name] = {
+        "mode": setting["mode"],
+        "fusion": (
+            default["fusion"] if pd.isna(setting["fusion"]) else setting["fusion"]
+        ),
+        "prefetch_multiplier": (
+            default["prefetch_multiplier"]
+            if pd.isna(setting["prefetch_multiplier"])
+            else int(setting["prefetch_multiplier"])
+        ),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(profiles, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency vs MRR sweep of the hybrid search settings"
+    )
+    parser.add_argument("--multipliers", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    parser.add_argument("--limits", type=int, nargs="+", default=[5, 10])
+    parser.add_argument(
+        "--fusions", nargs="+", choices=list(rag.FUSIONS), default=list(rag.FUSIONS)
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=list(rag.SEARCH_MODES),
+        default=list(rag.SEARCH_MODES),
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="questions in flight"
+    )
+    parser.add_argument("--latency", choices=["p50_ms", "p95_ms"], default="p95_ms")
+    parser.add_argument("--output", default="sweep.csv", help="csv of every setting")
+    parser.add_argument(
+        "--save-profile",
+        default=None,
+        help="save the best-mrr frontier setting as this search profile",
+    )
+    parser.add_argument(
+        "--max-latency-ms",
+        type=float,
+        default=None,
+        help="latency budget of --save-profile",
+    )
+    parser.add_argument(
+        "--serving-limit",
+        type=int,
+        default=5,
+        help="recipes retrieved per question in the app, the limit of --save-profile",
+    )
+    args = parser.parse_args()
+    if args.save_profile and args.serving_limit not in args.limits:
+        parser.error("--serving-limit must be one of --limits to save a profile")
+
+    ground_truth = load_ground_truth()
+    query_vectors = embed_queries(ground_truth["question"].tolist())
+
+    grid = search_grid(args.multipliers, args.limits, args.fusions, args.modes)
+    print(f"Sweeping {len(grid)} settings over {len(ground_truth)} questions")
+    df_results = pd.DataFrame(
+        [
+            run_setting(setting, ground_truth, query_vectors, args.concurrency)
+            for setting in grid
+        ]
+    )
+    # the MRR of different limits are not comparable: one frontier per limit
+    df_results["pareto"] = False
+    for _, df_limit in df_results.groupby("limit"):
+        df_results.loc[df_limit.index, "pareto"] = pareto_frontier(
+            df_limit[args.latency].to_numpy(), df_limit["mrr"].to_numpy()
+        )
+
+    df_frontier = df_results[df_results["pareto"]].sort_values(["limit", args.latency])
+    print(df_frontier.to_string(index=False, float_format="%.3f"))
+    df_results.to_csv(args.output, index=False)
+    df_frontier.to_csv(Path(args.output).with_suffix(".pareto.csv"), index=False)
+
+    if args.save_profile:
+        candidates = df_frontier[df_frontier["limit"] == args.serving_limit]
+        if args.max_latency_ms is not None:
+            candidates = candidates[candidates[args.latency] <= args.max_latency_ms]
+        if candidates.empty:
+            print("No frontier setting fits the latency budget, no profile saved")
+        else:
+            best = candidates.sort_values("mrr", ascending=False).iloc[0].to_dict()
+            save_search_profile(args.save_profile, best)
+            print(
+                f"Search profile '{args.save_profile}' saved to "
+                f"{rag.SEARCH_PROFILES_PATH}: {best}"
+            )
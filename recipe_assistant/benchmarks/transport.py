@@ -0,0 +1,113 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from qdrant_client import QdrantClient, models
+
+from .. import clients, ingest, rag
+from .retrieval import embed_queries, load_ground_truth
+
+
+def search_latency(
+    qdrant_client: QdrantClient,
+    query_vectors,
+    limit: int = 5,
+    concurrency: int = 8,
+) -> Dict[str, float]:
+    """latency of sequential searches and throughput of concurrent ones
+
+    The queries are embedded beforehand, so only the Qdrant round trip of the
+    hybrid query of qdrant_rrf_search is measured.
+    """
+    params = rag.SEARCH_PARAMS
+    queries = list(zip(*query_vectors))
+
+    def search(query):
+        dense, sparse = query
+        start_time = perf_counter()
+        rag.rrf_query_points(
+            dense,
+            sparse,
+            ingest.serving_collection_name(),
+            limit,
+            params,
+            qdrant_client,
+        )
+        return perf_counter() - start_time
+
+    # warm the connections up
+    for query in queries[:10]:
+        search(query)
+
+    latencies_ms = np.array([search(query) for query in queries]) * 1000
+
+    start_time = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(search, queries))
+    throughput = len(queries) / (perf_counter() - start_time)
+
+    return {
+        "search_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "search_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "search_p99_ms": float(np.percentile(latencies_ms, 99)),
+        "search_qps": throughput,
+    }
+
+
+def upsert_throughput(
+    qdrant_client: QdrantClient, points: List[models.PointStruct], repeat: int = 20
+) -> Dict[str, float]:
+    """points per second of a bulk upsert into a scratch collection"""
+    collection_name = "bench-transport"
+    if qdrant_client.collection_exists(collection_name):
+        qdrant_client.delete_collection(collection_name)
+    ingest.create_qdrant_collection(collection_name, qdrant_client=qdrant_client)
+
+    # copies of the recipes with new ids to upsert a realistic bulk
+    bulk = [
+        models.PointStruct(
+            id=i * len(points) + p.id, vector=p.vector, payload=p.payload
+        )
+        for i in range(repeat)
+        for p in points
+    ]
+    start_time = perf_counter()
+    ingest.upsert_points(bulk, collection_name, qdrant_client)
+    elapsed = perf_counter() - start_time
+
+    qdrant_client.delete_collection(collection_name)
+    return {"upsert_points_per_s": len(bulk) / elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="REST vs gRPC latency and throughput of Qdrant"
+    )
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="bulk size in corpus copies"
+    )
+    args = parser.parse_args()
+
+    query_vectors = embed_queries(load_ground_truth()["question"].tolist())
+    points = ingest.build_points(ingest.prepare_recipe_documents())
+
+    rows = []
+    for transport, prefer_grpc in [("rest", False), ("grpc", True)]:
+        qdrant_client = clients.create_qdrant_client(prefer_grpc=prefer_grpc)
+        rows.append(
+            {
+                "transport": transport,
+                **search_latency(
+                    qdrant_client, query_vectors, args.limit, args.concurrency
+                ),
+                **upsert_throughput(qdrant_client, points, args.repeat),
+            }
+        )
+        qdrant_client.close()
+
+    print(pd.DataFrame(rows).to_string(index=False, float_format="%.2f"))
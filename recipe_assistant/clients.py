@@ -0,0 +1,83 @@
+from qdrant_client import QdrantClient
+
+from .env import env_flag
+
+from dotenv import load_dotenv
+from typing import Optional
+import httpx
+import os
+import threading
+
+load_dotenv()
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# gRPC transport on QDRANT_GRPC_PORT of the same host, REST/JSON otherwise
+QDRANT_PREFER_GRPC = env_flag("QDRANT_PREFER_GRPC")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "10"))  # seconds
+# REST connection pool, gRPC multiplexes every call on one HTTP/2 channel
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", "20"))
+QDRANT_KEEPALIVE_EXPIRY = float(os.getenv("QDRANT_KEEPALIVE_EXPIRY", "30"))  # seconds
+QDRANT_GRPC_KEEPALIVE_MS = int(os.getenv("QDRANT_GRPC_KEEPALIVE_MS", "30000"))
+
+_qdrant_client: Optional[QdrantClient] = None
+_qdrant_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def create_qdrant_client(prefer_grpc: Optional[bool] = None) -> QdrantClient:
+    """new Qdrant client with the configured transport, pool, timeout and keep-alive
+
+    Args:
+        prefer_grpc (Optional[bool], optional): use gRPC instead of REST. Defaults to QDRANT_PREFER_GRPC.
+
+    Returns:
+        QdrantClient: a new client
+    """
+    if prefer_grpc is None:
+        prefer_grpc = QDRANT_PREFER_GRPC
+
+    return QdrantClient(
+        QDRANT_URL,
+        prefer_grpc=prefer_grpc,
+        grpc_port=QDRANT_GRPC_PORT,
+        timeout=QDRANT_TIMEOUT,
+        grpc_options={
+            "grpc.keepalive_time_ms": QDRANT_GRPC_KEEPALIVE_MS,
+            "grpc.keepalive_permit_without_calls": 1,
+        },
+        # passed on to the httpx client of the REST transport
+        limits=httpx.Limits(
+            max_connections=QDRANT_POOL_SIZE,
+            max_keepalive_connections=QDRANT_POOL_SIZE,
+            keepalive_expiry=QDRANT_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_qdrant_client() -> QdrantClient:
+    """Qdrant client of the current process, shared by search and ingestion
+
+    The client is created on first use and again after a fork, so that
+    pre-forked workers never share the parent's connections.
+
+    Returns:
+        QdrantClient: the shared client
+    """
+    global _qdrant_client, _qdrant_pid
+    if _qdrant_client is None or _qdrant_pid != os.getpid():
+        with _lock:
+            if _qdrant_client is None or _qdrant_pid != os.getpid():
+                _qdrant_client = create_qdrant_client()
+                _qdrant_pid = os.getpid()
+    return _qdrant_client
+
+
+def close_clients() -> None:
+    """close the clients of the current process, e.g. in the parent before forking"""
+    global _qdrant_client, _qdrant_pid
+    with _lock:
+        if _qdrant_client is not None and _qdrant_pid == os.getpid():
+            _qdrant_client.close()
+        _qdrant_client = None
+        _qdrant_pid = None
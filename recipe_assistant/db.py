@@ -1,7 +1,7 @@
 import os
 from datetime import datetime, timezone
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
 
 from dotenv import load_dotenv
 
@@ -40,6 +40,8 @@ def init_db():
                     eval_completion_tokens INTEGER NOT NULL,
                     eval_total_tokens INTEGER NOT NULL,
                     openai_cost FLOAT,
+                    -- how an "auto" request picked model_used, "manual" otherwise
+                    routing_decision TEXT NOT NULL DEFAULT 'manual',
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                 )
             """)
@@ -48,9 +50,30 @@ def init_db():
                     id SERIAL PRIMARY KEY,
                     conversation_id TEXT REFERENCES conversations(id),
                     feedback INTEGER NOT NULL,
-                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+                    -- client retries with the same key are stored once per conversation
+                    idempotency_key TEXT,
+                    UNIQUE (conversation_id, idempotency_key)
                 )
             """)
+
+            # keyset pagination of the conversation history, optionally filtered
+            cur.execute("""
+                CREATE INDEX idx_conversations_timestamp_id
+                ON conversations (timestamp DESC, id DESC)
+            """)
+            cur.execute("""
+                CREATE INDEX idx_conversations_relevance_timestamp_id
+                ON conversations (relevance, timestamp DESC, id DESC)
+            """)
+            cur.execute("""
+                CREATE INDEX idx_conversations_model_timestamp_id
+                ON conversations (model_used, timestamp DESC, id DESC)
+            """)
+            cur.execute("""
+                CREATE INDEX idx_feedback_conversation_id
+                ON feedback (conversation_id)
+            """)
         conn.commit()
     finally:
         conn.close()
@@ -68,8 +91,9 @@ def save_conversation(conversation_id, question, answer_data, timestamp=None):
                 INSERT INTO conversations 
                 (id, question, answer, model_used, response_time, relevance, 
                 relevance_explanation, prompt_tokens, completion_tokens, total_tokens, 
-                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, openai_cost,
+                routing_decision, timestamp)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """,
                 (
                     conversation_id,
@@ -86,6 +110,7 @@ def save_conversation(conversation_id, question, answer_data, timestamp=None):
                     answer_data["eval_completion_tokens"],
                     answer_data["eval_total_tokens"],
                     answer_data["openai_cost"],
+                    answer_data.get("routing_decision", "manual"),
                     timestamp,
                 ),
             )
@@ -94,36 +119,177 @@ def save_conversation(conversation_id, question, answer_data, timestamp=None):
         conn.close()
 
 
-def save_feedback(conversation_id, feedback, timestamp=None):
+def save_feedback(conversation_id, feedback, timestamp=None, idempotency_key=None):
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO feedback (conversation_id, feedback, timestamp, idempotency_key)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (conversation_id, idempotency_key) DO NOTHING
+                """,
+                (conversation_id, feedback, timestamp, idempotency_key),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def save_feedback_bulk(items, timestamp=None):
+    """save many feedbacks with one lookup and one insert
+
+    Args:
+        items (list): (conversation_id, feedback, idempotency_key) tuples, the key may be None
+        timestamp (datetime, optional): timestamp of every feedback. Defaults to now.
+
+    Returns:
+        list: status of each item, "created", "duplicate" (idempotency key already used for the conversation) or "unknown_conversation"
+    """
     if timestamp is None:
         timestamp = datetime.now(timezone.utc)
+    if not items:
+        return []
 
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
             cur.execute(
-                "INSERT INTO feedback (conversation_id, feedback, timestamp) VALUES (%s, %s, %s)",
-                (conversation_id, feedback, timestamp),
+                "SELECT id FROM conversations WHERE id = ANY(%s)",
+                (list({conversation_id for conversation_id, _, _ in items}),),
             )
+            known_ids = {row[0] for row in cur.fetchall()}
+
+            rows = [
+                (conversation_id, feedback, timestamp, idempotency_key)
+                for conversation_id, feedback, idempotency_key in items
+                if conversation_id in known_ids
+            ]
+            inserted_keys = set()
+            if rows:
+                inserted = execute_values(
+                    cur,
+                    """
+                    INSERT INTO feedback (conversation_id, feedback, timestamp, idempotency_key)
+                    VALUES %s
+                    ON CONFLICT (conversation_id, idempotency_key) DO NOTHING
+                    RETURNING conversation_id, idempotency_key
+                    """,
+                    rows,
+                    page_size=len(rows),
+                    fetch=True,
+                )
+                inserted_keys = {tuple(row) for row in inserted if row[1] is not None}
         conn.commit()
     finally:
         conn.close()
 
+    return bulk_feedback_statuses(items, known_ids, inserted_keys)
+
+
+def bulk_feedback_statuses(items, known_ids, inserted_keys):
+    """status of each item of a bulk feedback insert
+
+    Args:
+        items (list): (conversation_id, feedback, idempotency_key) tuples, the key may be None
+        known_ids (set): ids of the conversations that exist
+        inserted_keys (set): (conversation_id, idempotency_key) of the inserted rows with a key
+
+    Returns:
+        list: status of each item, "created", "duplicate" or "unknown_conversation"
+    """
+    inserted_keys = set(inserted_keys)
+    statuses = []
+    for conversation_id, _, idempotency_key in items:
+        if conversation_id not in known_ids:
+            statuses.append("unknown_conversation")
+        elif idempotency_key is None:
+            statuses.append("created")
+        elif (conversation_id, idempotency_key) in inserted_keys:
+            # a key repeated within the batch is only inserted once
+            inserted_keys.discard((conversation_id, idempotency_key))
+            statuses.append("created")
+        else:
+            statuses.append("duplicate")
+    return statuses
+
 
 def get_recent_conversation(limit=5, relevance=None):
+    return get_conversations_page(limit=limit, relevance=relevance)
+
+
+def get_conversations_page(
+    limit=20,
+    after=None,
+    relevance=None,
+    model=None,
+    start_time=None,
+    end_time=None,
+):
+    """one page of conversations, newest first, with their feedback aggregated
+
+    Args:
+        limit (int, optional): page size. Defaults to 20.
+        after (tuple, optional): (timestamp, id) of the last conversation of the previous page. Defaults to None (first page).
+        relevance (str, optional): only this relevance. Defaults to None.
+        model (str, optional): only this model. Defaults to None.
+        start_time (datetime, optional): only conversations at or after this time. Defaults to None.
+        end_time (datetime, optional): only conversations before this time. Defaults to None.
+
+    Returns:
+        list: conversations with their thumbs_up and thumbs_down counts
+    """
+    conditions = []
+    params = []
+    if after is not None:
+        # keyset: seeks in the (timestamp, id) index instead of skipping rows
+        conditions.append("(c.timestamp, c.id) < (%s, %s)")
+        params.extend(after)
+    if relevance:
+        conditions.append("c.relevance = %s")
+        params.append(relevance)
+    if model:
+        conditions.append("c.model_used = %s")
+        params.append(model)
+    if start_time:
+        conditions.append("c.timestamp >= %s")
+        params.append(start_time)
+    if end_time:
+        conditions.append("c.timestamp < %s")
+        params.append(end_time)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(limit)
+
     conn = get_db_connection()
     try:
         with conn.cursor(cursor_factory=DictCursor) as cur:
-            query = """
-                SELECT c.*, f.feedback
-                FROM conversations c
-                LEFT JOIN feedback f ON c.id. = f.conversation_id
-            """
-            if relevance:
-                query += f" WHERE c.relevance = '{relevance}'"
-            query += " ORDER BY c.timestamp DESC LIMIT %s"
-
-            cur.execute(query, (limit,))
+            cur.execute(
+                f"""
+                SELECT page.*,
+                    COALESCE(f.thumbs_up, 0) AS thumbs_up,
+                    COALESCE(f.thumbs_down, 0) AS thumbs_down
+                FROM (
+                    SELECT c.*
+                    FROM conversations c
+                    {where}
+                    ORDER BY c.timestamp DESC, c.id DESC
+                    LIMIT %s
+                ) page
+                LEFT JOIN LATERAL (
+                    SELECT
+                        SUM(CASE WHEN feedback > 0 THEN 1 ELSE 0 END) AS thumbs_up,
+                        SUM(CASE WHEN feedback < 0 THEN 1 ELSE 0 END) AS thumbs_down
+                    FROM feedback
+                    WHERE feedback.conversation_id = page.id
+                ) f ON TRUE
+                ORDER BY page.timestamp DESC, page.id DESC
+                """,
+                params,
+            )
             return cur.fetchall()
     finally:
         conn.close()
@@ -142,3 +308,22 @@ def get_feedback_stats():
             return cur.fetchone()
     finally:
         conn.close()
+
+
+def get_top_questions(limit=100):
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT question, COUNT(*) AS asked
+                FROM conversations
+                GROUP BY question
+                ORDER BY asked DESC, MAX(timestamp) DESC
+                LIMIT %s
+                """,
+                (limit,),
+            )
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
@@ -0,0 +1,162 @@
+from fastembed import TextEmbedding, SparseTextEmbedding
+from qdrant_client import models
+
+from dotenv import load_dotenv
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import numpy as np
+import os
+import threading
+
+load_dotenv()
+
+DENSE_MODEL_NAME = "jinaai/jina-embeddings-v2-small-en"
+SPARSE_MODEL_NAME = "Qdrant/bm25"
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+# local model cache: with MODEL_LOCAL_FILES_ONLY the models are never downloaded,
+# run `python -m recipe_assistant.embeddings` beforehand to fill the cache
+MODEL_CACHE_DIR: Optional[str] = os.getenv("MODEL_CACHE_DIR") or None
+MODEL_LOCAL_FILES_ONLY = os.getenv("MODEL_LOCAL_FILES_ONLY", "false").lower() in (
+    "1",
+    "true",
+)
+# onnxruntime threads per model, None lets onnxruntime decide
+EMBEDDING_THREADS: Optional[int] = (
+    int(os.environ["EMBEDDING_THREADS"]) if os.getenv("EMBEDDING_THREADS") else None
+)
+
+_dense_model = None
+_sparse_model = None
+_model_lock = threading.Lock()
+
+
+def get_dense_model() -> TextEmbedding:
+    """load (once) the dense embedding model used for the "jina-small" vectors
+
+    Returns:
+        TextEmbedding: fastembed dense model
+    """
+    global _dense_model
+    if _dense_model is None:
+        with _model_lock:
+            if _dense_model is None:
+                _dense_model = TextEmbedding(
+                    model_name=DENSE_MODEL_NAME,
+                    cache_dir=MODEL_CACHE_DIR,
+                    threads=EMBEDDING_THREADS,
+                    local_files_only=MODEL_LOCAL_FILES_ONLY,
+                )
+    return _dense_model
+
+
+def get_sparse_model() -> SparseTextEmbedding:
+    """load (once) the sparse embedding model used for the "bm25" vectors
+
+    Returns:
+        SparseTextEmbedding: fastembed sparse model
+    """
+    global _sparse_model
+    if _sparse_model is None:
+        with _model_lock:
+            if _sparse_model is None:
+                _sparse_model = SparseTextEmbedding(
+                    model_name=SPARSE_MODEL_NAME,
+                    cache_dir=MODEL_CACHE_DIR,
+                    threads=EMBEDDING_THREADS,
+                    local_files_only=MODEL_LOCAL_FILES_ONLY,
+                )
+    return _sparse_model
+
+
+def preload() -> None:
+    """load both models and run them once, so that their weights are in memory"""
+    list(get_dense_model().embed(["preload"]))
+    list(get_sparse_model().embed(["preload"]))
+
+
+@lru_cache(maxsize=EMBEDDING_CACHE_SIZE)
+def embed_dense_query(query: str) -> Tuple[float, ...]:
+    """embed a query with the dense model, cached per query text
+
+    Args:
+        query (str): user query
+
+    Returns:
+        Tuple[float, ...]: dense query vector
+    """
+    vector = next(iter(get_dense_model().query_embed(query)))
+    return tuple(vector.tolist())
+
+
+@lru_cache(maxsize=EMBEDDING_CACHE_SIZE)
+def embed_sparse_query(query: str) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+    """embed a query with the sparse model, cached per query text
+
+    Args:
+        query (str): user query
+
+    Returns:
+        Tuple[Tuple[int, ...], Tuple[float, ...]]: sparse indices and values
+    """
+    embedding = next(iter(get_sparse_model().query_embed(query)))
+    return tuple(embedding.indices.tolist()), tuple(embedding.values.tolist())
+
+
+def dense_query_vector(query: str) -> List[float]:
+    return list(embed_dense_query(query))
+
+
+def sparse_query_vector(query: str) -> models.SparseVector:
+    indices, values = embed_sparse_query(query)
+    return models.SparseVector(indices=list(indices), values=list(values))
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """embed documents with the dense model, not cached
+
+    Args:
+        texts (List[str]): texts to embed
+
+    Returns:
+        np.ndarray: one dense vector per text
+    """
+    return np.array(list(get_dense_model().embed(texts)))
+
+
+def embed_documents(
+    texts: List[str],
+) -> Tuple[List[List[float]], List[models.SparseVector]]:
+    """embed documents for indexing with both models
+
+    Args:
+        texts (List[str]): documents to embed
+
+    Returns:
+        Tuple[List[List[float]], List[models.SparseVector]]: dense and sparse vector of each document
+    """
+    dense_vectors = [vector.tolist() for vector in get_dense_model().embed(texts)]
+    sparse_vectors = [
+        models.SparseVector(
+            indices=embedding.indices.tolist(), values=embedding.values.tolist()
+        )
+        for embedding in get_sparse_model().embed(texts)
+    ]
+    return dense_vectors, sparse_vectors
+
+
+def embedding_cache_info() -> dict:
+    """hit/miss statistics of the query embedding caches"""
+    return {
+        "dense": embed_dense_query.cache_info()._asdict(),
+        "sparse": embed_sparse_query.cache_info()._asdict(),
+    }
+
+
+if __name__ == "__main__":
+    # download the models into MODEL_CACHE_DIR, e.g. while building the image
+    preload()
+    print(
+        f"Models {DENSE_MODEL_NAME} and {SPARSE_MODEL_NAME} cached in "
+        f"{MODEL_CACHE_DIR or 'the default cache directory'}"
+    )
@@ -0,0 +1,20 @@
+import os
+
+
+def parse_flag(value: str) -> bool:
+    """boolean of an environment setting: "1" or "true", in any case, is True"""
+    return value.strip().lower() in ("1", "true")
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """boolean environment setting
+
+    Args:
+        name (str): environment variable
+        default (bool, optional): value when it is not set. Defaults to False.
+
+    Returns:
+        bool: True for "1" or "true"
+    """
+    value = os.getenv(name)
+    return default if value is None else parse_flag(value)
@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from time import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from . import rag
+from .ingest import QUESTIONS_PATH, project_root
+
+
+def _result_key(record: Dict) -> str:
+    return f"{record['id']}|{record['question']}"
+
+
+def checkpoint_name(
+    llm_model: str, questions: str, sample: Optional[int], limit: int
+) -> str:
+    """default checkpoint file of a run, one per model and set of questions
+
+    Args:
+        llm_model (str): llm model
+        questions (str): path to the question csv
+        sample (Optional[int]): random subset size, None for every question
+        limit (int): number of retrieved recipes
+
+    Returns:
+        str: file name, with a hash of the questions, sample and limit
+    """
+    run = {
+        "questions": str(Path(questions).resolve()),
+        "sample": sample,
+        "limit": limit,
+    }
+    digest = hashlib.sha256(json.dumps(run, sort_keys=True).encode()).hexdigest()[:8]
+    return f"eval-checkpoint-{llm_model}-{digest}.jsonl"
+
+
+def load_checkpoint(path: Path) -> Dict[str, Dict]:
+    """results of a previous run, keyed by recipe id and question
+
+    Args:
+        path (Path): checkpoint path (jsonl, one result per line)
+
+    Returns:
+        Dict[str, Dict]: finished results
+    """
+    results = {}
+    if not path.exists():
+        return results
+
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of an interrupted run may be incomplete
+                continue
+            results[_result_key(record)] = record
+    return results
+
+
+def evaluate_question(record: Dict, llm_model: str, limit: int = 5) -> Dict:
+    """answer one question with the rag pipeline and judge its answer
+
+    Args:
+        record (Dict): question and the id of its recipe
+        llm_model (str): llm model
+        limit (int, optional): number of retrieved recipes. Defaults to 5.
+
+    Returns:
+        Dict: answer, relevance, cost and latencies of the question
+    """
+    start_time = time()
+    answer_data = rag.rag(record["question"], llm_model=llm_model, limit=limit)
+    rag_time = time() - start_time
+
+    openai_cost = answer_data["openai_cost"]
+    if answer_data["eval_total_tokens"] > 0:
+        # rag() already asked the LLM judge
+        relevance = answer_data["relevance"]
+        explanation = answer_data["relevance_explanation"]
+    else:
+        evaluation, tokens = rag.evalualte_relevance(
+            record["question"], answer_data["answer"]
+        )
+        relevance = evaluation.get("Relevance", "UNKNOWN")
+        explanation = evaluation.get("Explanation", "Failed to parse evaluation")
+        eval_cost = rag.calculate_openai_cost(rag.EVAL_MODEL, tokens)
+        if openai_cost is not None and eval_cost is not None:
+            openai_cost += eval_cost
+        else:
+            openai_cost = None
+
+    return {
+        "id": record["id"],
+        "question": record["question"],
+        "answer": answer_data["answer"],
+        "relevance": relevance,
+        "explanation": explanation,
+        "model_used": llm_model,
+        "openai_cost": openai_cost,
+        "rag_time": rag_time,
+        "total_time": time() - start_time,
+        "fallback": answer_data.get("fallback") is not None,
+    }
+
+
+def run_evaluation(
+    records: List[Dict],
+    llm_model: str = "gpt-4o-mini",
+    checkpoint_path: Optional[Path] = None,
+    limit: int = 5,
+    concurrency: int = 8,
+) -> List[Dict]:
+    """evaluate the questions concurrently, appending each result to the checkpoint
+
+    Questions already in the checkpoint are skipped, so an interrupted run resumes
+    where it stopped. Failed questions are not checkpointed and run again next time.
+    On Ctrl-C, the questions in flight finish and are checkpointed, and no other
+    question starts.
+
+    Args:
+        records (List[Dict]): questions with the id of their recipe
+        llm_model (str, optional): llm model. Defaults to "gpt-4o-mini".
+        checkpoint_path (Optional[Path], optional): jsonl checkpoint. Defaults to None (no checkpoint).
+        limit (int, optional): number of retrieved recipes. Defaults to 5.
+        concurrency (int, optional): maximum number of questions in flight. Defaults to 8.
+
+    Returns:
+        List[Dict]: results of every finished question, previous runs included
+    """
+    done = load_checkpoint(checkpoint_path) if checkpoint_path else {}
+    todo = [record for record in records if _result_key(record) not in done]
+    print(f"{len(done)} questions already evaluated, {len(todo)} to go")
+
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint = open(checkpoint_path, "a")
+
+    failed = 0
+
+    def save(future, record: Dict) -> None:
+        nonlocal failed
+        try:
+            result = future.result()
+        except Exception as e:
+            failed += 1
+            print(f"Evaluation failed for '{record['question']}': {e}")
+            return
+
+        done[_result_key(result)] = result
+        if checkpoint is not None:
+            checkpoint.write(json.dumps(result) + "\n")
+            checkpoint.flush()
+
+    # at most `concurrency` questions are submitted, so an interrupt leaves no queue behind
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    remaining = iter(todo)
+    pending = {}
+    evaluated = 0
+    try:
+        for record in itertools.islice(remaining, max(1, concurrency)):
+            pending[executor.submit(evaluate_question, record, llm_model, limit)] = (
+                record
+            )
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                save(future, pending.pop(future))
+                evaluated += 1
+                if evaluated % 50 == 0:
+                    print(f"{evaluated}/{len(todo)} evaluated")
+
+                record = next(remaining, None)
+                if record is not None:
+                    pending[
+                        executor.submit(evaluate_question, record, llm_model, limit)
+                    ] = record
+    except KeyboardInterrupt:
+        print("Interrupted, saving the questions in flight")
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future, record in pending.items():
+            if not future.cancelled():
+                save(future, record)
+        print("Run again to resume")
+    finally:
+        executor.shutdown(wait=True)
+        if checkpoint is not None:
+            checkpoint.close()
+
+    if failed:
+        print(f"{failed} questions failed, run again to retry them")
+    return list(done.values())
+
+
+def summarize(results: List[Dict]) -> Dict:
+    """relevance distribution, total cost and latency percentiles of the results"""
+    if not results:
+        return {"questions": 0}
+
+    df_results = pd.DataFrame(results)
+    rag_times = df_results["rag_time"].to_numpy()
+    total_times = df_results["total_time"].to_numpy()
+
+    return {
+        "questions": len(df_results),
+        "relevance": df_results["relevance"].value_counts().to_dict(),
+        "relevance_share": df_results["relevance"]
+        .value_counts(normalize=True)
+        .round(3)
+        .to_dict(),
+        "fallbacks": int(df_results["fallback"].sum()),
+        # None when the cost of a model is unknown
+        "total_cost": (
+            None
+            if df_results["openai_cost"].isna().any()
+            else float(df_results["openai_cost"].sum())
+        ),
+        "rag_latency_s": {
+            f"p{q}": float(np.percentile(rag_times, q)) for q in (50, 90, 95, 99)
+        },
+        "total_latency_s": {
+            f"p{q}": float(np.percentile(total_times, q)) for q in (50, 90, 95, 99)
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate the answers of the RAG flow with the LLM judge"
+    )
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH))
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sample", type=int, default=None, help="random subset size")
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="jsonl checkpoint, defaults to data/eval-checkpoint-<model>-<hash of questions, sample, limit>.jsonl",
+    )
+    parser.add_argument("--output", default=None, help="optional csv output")
+    parser.add_argument(
+        "--base-url",
+        default=None,
+        help="OpenAI-compatible endpoint, e.g. http://localhost:8001/v1 for openai_stub",
+    )
+    args = parser.parse_args()
+
+    if args.base_url:
+        # read by the OpenAI client, created on the first call
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    # every question must go through the llm for the costs and latencies to be meaningful
+    rag.ANSWER_CACHE_SIZE = 0
+
+    df_questions = pd.read_csv(args.questions)
+    if args.sample:
+        df_questions = df_questions.sample(n=args.sample, random_state=1)
+    records = df_questions[["id", "question"]].to_dict(orient="records")
+
+    # a run with other questions or another limit does not resume this one
+    checkpoint_path = Path(
+        args.checkpoint
+        or project_root
+        / "data"
+        / checkpoint_name(args.model, args.questions, args.sample, args.limit)
+    )
+    results = run_evaluation(
+        records,
+        llm_model=args.model,
+        checkpoint_path=checkpoint_path,
+        limit=args.limit,
+        concurrency=args.concurrency,
+    )
+
+    print(json.dumps(summarize(results), indent=2))
+    if args.output:
+        pd.DataFrame(results)[
+            ["answer", "id", "question", "relevance", "explanation"]
+        ].to_csv(args.output, index=False)
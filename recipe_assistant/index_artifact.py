@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import models
+
+from . import embeddings
+from . import ingest
+
+load_dotenv()
+
+# portable index: precomputed dense and sparse vectors with their payloads,
+# restored into Qdrant at startup instead of embedding the corpus again
+INDEX_ARTIFACT_DIR = Path(
+    os.getenv("INDEX_ARTIFACT_DIR", ingest.project_root / "data" / "index")
+)
+
+
+def artifact_path(version: str, artifact_dir: Path = INDEX_ARTIFACT_DIR) -> Path:
+    return Path(artifact_dir) / f"recipes-{version}.npz"
+
+
+def build_artifact(
+    data_path: str = ingest.DATA_PATH,
+    artifact_dir: Path = INDEX_ARTIFACT_DIR,
+    mode: str = ingest.INDEX_MODE,
+) -> Path:
+    """embed the recipes once and save the vectors as a versioned artifact
+
+    Args:
+        data_path (str, optional): path to the recipe data source. Defaults to ingest.DATA_PATH.
+        artifact_dir (Path, optional): output directory. Defaults to INDEX_ARTIFACT_DIR.
+        mode (str, optional): index mode. Defaults to ingest.INDEX_MODE.
+
+    Returns:
+        Path: path of the artifact
+    """
+    version = ingest.index_version(data_path, mode)
+    points = ingest.build_points(
+        ingest.prepare_index_documents(mode, data_path), version
+    )
+
+    sparse_offsets = np.cumsum([0] + [len(p.vector["bm25"].indices) for p in points])
+    path = artifact_path(version, artifact_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        path,
+        ids=np.array([p.id for p in points], dtype=np.int64),
+        dense=np.array([p.vector["jina-small"] for p in points], dtype=np.float32),
+        sparse_indices=np.concatenate(
+            [np.array(p.vector["bm25"].indices, dtype=np.uint32) for p in points]
+        ),
+        sparse_values=np.concatenate(
+            [np.array(p.vector["bm25"].values, dtype=np.float32) for p in points]
+        ),
+        sparse_offsets=sparse_offsets.astype(np.int64),
+        payloads=np.array(json.dumps([p.payload for p in points])),
+    )
+
+    manifest = {
+        "version": version,
+        "points": len(points),
+        "mode": mode,
+        "dense_model": embeddings.DENSE_MODEL_NAME,
+        "sparse_model": embeddings.SPARSE_MODEL_NAME,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(path.with_suffix(".json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return path
+
+
+def find_artifact(
+    version: str, artifact_dir: Path = INDEX_ARTIFACT_DIR
+) -> Optional[Path]:
+    path = artifact_path(version, artifact_dir)
+    return path if path.exists() else None
+
+
+def load_points(path: Path) -> List[models.PointStruct]:
+    """read the points of an artifact, without embedding anything
+
+    Args:
+        path (Path): artifact path
+
+    Returns:
+        List[models.PointStruct]: points ready to be upserted
+    """
+    with np.load(path) as artifact:
+        ids = artifact["ids"]
+        dense = artifact["dense"]
+        sparse_indices = artifact["sparse_indices"]
+        sparse_values = artifact["sparse_values"]
+        sparse_offsets = artifact["sparse_offsets"]
+        payloads = json.loads(str(artifact["payloads"]))
+
+    points = []
+    for i, payload in enumerate(payloads):
+        start, end = sparse_offsets[i], sparse_offsets[i + 1]
+        points.append(
+            models.PointStruct(
+                id=int(ids[i]),
+                vector={
+                    "jina-small": dense[i].tolist(),
+                    "bm25": models.SparseVector(
+                        indices=sparse_indices[start:end].tolist(),
+                        values=sparse_values[start:end].tolist(),
+                    ),
+                },
+                payload=payload,
+            )
+        )
+    return points
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the versioned index artifact of the recipes"
+    )
+    parser.add_argument("--output-dir", default=str(INDEX_ARTIFACT_DIR))
+    parser.add_argument(
+        "--mode", choices=["recipe", "chunked"], default=ingest.INDEX_MODE
+    )
+    args = parser.parse_args()
+
+    path = build_artifact(artifact_dir=Path(args.output_dir), mode=args.mode)
+    print(f"Index artifact saved to {path}")
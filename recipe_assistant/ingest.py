@@ -1,6 +1,12 @@
 import pandas as pd
 from qdrant_client import QdrantClient, models
-from typing import List, Dict, Any
+from . import clients
+from . import embeddings
+from .env import parse_flag
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+import json
 import os
 from dotenv import load_dotenv
 
@@ -12,19 +18,137 @@ load_dotenv()
 current_file = Path(__file__)  # ingest.py location
 project_root = current_file.parent.parent  # Go up to recipe-rag-assistant
 DATA_PATH = project_root / "data" / "recipes.csv"
+# ground truth questions of the evaluation, the benchmarks and the warm-up
+QUESTIONS_PATH = project_root / "data" / "ground-truth-retrieval.csv"
 COLLECTION_NAME = "recipe-rag-hybrid"
 
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-qdrant_client = QdrantClient(QDRANT_URL)
+# "recipe": one point per recipe, "chunked": one point per recipe field
+INDEX_MODE = os.getenv("INDEX_MODE", "recipe")
+CHUNKS_COLLECTION_NAME = "recipe-rag-chunks"
+CHUNK_FIELDS = ["description", "ingredients", "directions"]
 
+RECIPE_PAYLOAD_FIELDS = [
+    "recipe_id",
+    "text",
+    "recipe_name",
+    "recipe_link",
+    "recipe_description",
+    "ratings",
+    "ready-in",
+    "directions",
+    "ingredients",
+]
 
-def create_qdrant_collection(collection_name: str = COLLECTION_NAME) -> None:
+# bump when the points layout changes, it invalidates every index version
+INDEX_FORMAT = 1
+UPSERT_BATCH_SIZE = 256
+
+# storage and HNSW settings of the dense vectors, selected by QDRANT_COLLECTION_PROFILE
+DEFAULT_PROFILE = {
+    "quantization": None,  # None, "scalar" (int8) or "binary"
+    "rescore": True,  # rescore the quantized candidates with the original vectors
+    "oversampling": 2.0,  # candidates fetched with quantized vectors per result
+    "on_disk_vectors": False,
+    "on_disk_payload": False,
+    "hnsw_m": 16,
+    "hnsw_ef_construct": 100,
+    "search_ef": None,  # hnsw_ef at search time, None for Qdrant's default
+}
+
+COLLECTION_PROFILES = {
+    "default": {},
+    "int8": {"quantization": "scalar"},
+    "int8-on-disk": {
+        "quantization": "scalar",
+        "on_disk_vectors": True,
+        "on_disk_payload": True,
+    },
+    "binary": {"quantization": "binary", "oversampling": 3.0},
+    "binary-on-disk": {
+        "quantization": "binary",
+        "oversampling": 3.0,
+        "on_disk_vectors": True,
+        "on_disk_payload": True,
+    },
+    "high-recall": {"hnsw_m": 32, "hnsw_ef_construct": 200, "search_ef": 128},
+}
+
+# individual settings overriding the selected profile
+PROFILE_ENV_OVERRIDES = {
+    "quantization": ("QDRANT_QUANTIZATION", lambda v: None if v == "none" else v),
+    "rescore": ("QDRANT_QUANTIZATION_RESCORE", parse_flag),
+    "oversampling": ("QDRANT_QUANTIZATION_OVERSAMPLING", float),
+    "on_disk_vectors": ("QDRANT_ON_DISK_VECTORS", parse_flag),
+    "on_disk_payload": ("QDRANT_ON_DISK_PAYLOAD", parse_flag),
+    "hnsw_m": ("QDRANT_HNSW_M", int),
+    "hnsw_ef_construct": ("QDRANT_HNSW_EF_CONSTRUCT", int),
+    "search_ef": ("QDRANT_SEARCH_EF", int),
+}
+
+
+def get_collection_profile(name: Optional[str] = None) -> Dict[str, Any]:
+    """settings of a collection profile
+
+    Args:
+        name (Optional[str], optional): profile name. Defaults to QDRANT_COLLECTION_PROFILE, or "default".
+
+    Returns:
+        Dict[str, Any]: the profile settings, with the environment overrides applied
+    """
+    name = name or os.getenv("QDRANT_COLLECTION_PROFILE", "default")
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(f"Unknown collection profile: {name}")
+
+    profile = {**DEFAULT_PROFILE, **COLLECTION_PROFILES[name]}
+    for key, (env_name, parse) in PROFILE_ENV_OVERRIDES.items():
+        value = os.getenv(env_name)
+        if value:
+            profile[key] = parse(value)
+    return profile
+
+
+def quantization_config(profile: Dict[str, Any]) -> Optional[models.QuantizationConfig]:
+    if profile["quantization"] == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if profile["quantization"] == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    return None
+
+
+def search_params(profile: Dict[str, Any]) -> Optional[models.SearchParams]:
+    """search-time parameters of the dense vectors for a collection profile"""
+    quantization = None
+    if profile["quantization"] is not None:
+        quantization = models.QuantizationSearchParams(
+            rescore=profile["rescore"], oversampling=profile["oversampling"]
+        )
+    if quantization is None and profile["search_ef"] is None:
+        return None
+    return models.SearchParams(hnsw_ef=profile["search_ef"], quantization=quantization)
+
+
+def create_qdrant_collection(
+    collection_name: str = COLLECTION_NAME,
+    profile: Optional[Dict[str, Any]] = None,
+    qdrant_client: Optional[QdrantClient] = None,
+) -> None:
     """create a collection within Qdrant Vector DB for hybrid search
 
     Args:
         collection_name (str): the name of the collection to be created. Defaults to COLLECTION_NAME.
+        profile (Optional[Dict[str, Any]], optional): collection profile. Defaults to get_collection_profile().
+        qdrant_client (Optional[QdrantClient], optional): client to create it with. Defaults to the shared client.
     """
 
+    qdrant_client = qdrant_client or clients.get_qdrant_client()
+    profile = profile or get_collection_profile()
+
     # hybrid search with Qdrant
     if not qdrant_client.collection_exists(collection_name):
         qdrant_client.create_collection(
@@ -34,6 +158,12 @@ def create_qdrant_collection(collection_name: str = COLLECTION_NAME) -> None:
                 "jina-small": models.VectorParams(
                     size=512,
                     distance=models.Distance.COSINE,
+                    on_disk=profile["on_disk_vectors"],
+                    hnsw_config=models.HnswConfigDiff(
+                        m=profile["hnsw_m"],
+                        ef_construct=profile["hnsw_ef_construct"],
+                    ),
+                    quantization_config=quantization_config(profile),
                 ),
             },
             sparse_vectors_config={
@@ -41,9 +171,45 @@ def create_qdrant_collection(collection_name: str = COLLECTION_NAME) -> None:
                     modifier=models.Modifier.IDF,
                 )
             },
+            on_disk_payload=profile["on_disk_payload"],
         )
 
 
+def collection_matches_profile(
+    profile: Dict[str, Any], collection_name: str = COLLECTION_NAME
+) -> bool:
+    """whether an existing collection was created with the storage settings of the profile"""
+    config = clients.get_qdrant_client().get_collection(collection_name).config
+    vector_params = config.params.vectors["jina-small"]
+    hnsw_config = vector_params.hnsw_config or config.hnsw_config
+    quantization = vector_params.quantization_config or config.quantization_config
+
+    quantization_type = None
+    if isinstance(quantization, models.ScalarQuantization):
+        quantization_type = "scalar"
+    elif isinstance(quantization, models.BinaryQuantization):
+        quantization_type = "binary"
+
+    return (
+        quantization_type == profile["quantization"]
+        and bool(vector_params.on_disk) == profile["on_disk_vectors"]
+        and bool(config.params.on_disk_payload) == profile["on_disk_payload"]
+        and hnsw_config.m == profile["hnsw_m"]
+        and hnsw_config.ef_construct == profile["hnsw_ef_construct"]
+    )
+
+
+def joined_fields(recipe: Dict[str, Any]) -> Tuple[str, str]:
+    """directions and ingredients of a recipe, stored as python lists in the csv, as text
+
+    Returns:
+        Tuple[str, str]: directions joined with spaces, ingredients joined with semicolons
+    """
+    directions_joined = " ".join(eval(recipe["directions"]))
+    ingredients_joined = "; ".join(eval(recipe["ingredients"]))
+    return directions_joined.strip(), ingredients_joined.strip()
+
+
 def prepare_recipe_documents(data_path: str = DATA_PATH) -> List[Dict[str, Any]]:
     """prepare the recipe documents for indexing
 
@@ -59,49 +225,246 @@ def prepare_recipe_documents(data_path: str = DATA_PATH) -> List[Dict[str, Any]]
 
     for recipe in recipes_documents:
         description_stripped = recipe["recipe_description"].strip()
-        directions_joined = " ".join(eval(recipe["directions"]))
-        ingredients_joined = "; ".join(eval(recipe["ingredients"]))
+        directions_joined, ingredients_joined = joined_fields(recipe)
 
-        text = f"Recipe: {recipe['recipe_name'].strip()} | Description: {description_stripped} | Ratings: {recipe['ratings'].strip()} | Ready in: {recipe['ready-in'].strip()} | Directions: {directions_joined.strip()} | Ingredients: {ingredients_joined.strip()}"
+        text = f"Recipe: {recipe['recipe_name'].strip()} | Description: {description_stripped} | Ratings: {recipe['ratings'].strip()} | Ready in: {recipe['ready-in'].strip()} | Directions: {directions_joined} | Ingredients: {ingredients_joined}"
 
         recipe["text"] = text
 
     return recipes_documents
 
 
-def index_documents() -> None:
-    """index the Qdrant vector DB with recipes documents"""
-    recipes_documents = prepare_recipe_documents()
+def prepare_recipe_chunks(
+    recipes_documents: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """split the recipe documents into one chunk per field
+
+    Args:
+        recipes_documents (List[Dict[str, Any]]): prepared recipe documents
+
+    Returns:
+        List[Dict[str, Any]]: chunks, each with its recipe, field and chunk_text
+    """
+    chunks = []
+
+    for recipe in recipes_documents:
+        recipe_name = recipe["recipe_name"].strip()
+        directions_joined, ingredients_joined = joined_fields(recipe)
+
+        # the recipe name goes with every chunk so each one can be matched on its own
+        chunk_texts = {
+            "description": f"Recipe: {recipe_name} | Description: {recipe['recipe_description'].strip()} | Ratings: {recipe['ratings'].strip()} | Ready in: {recipe['ready-in'].strip()}",
+            "ingredients": f"Recipe: {recipe_name} | Ingredients: {ingredients_joined}",
+            "directions": f"Recipe: {recipe_name} | Directions: {directions_joined}",
+        }
+
+        for field_index, field in enumerate(CHUNK_FIELDS):
+            chunks.append(
+                {
+                    **recipe,
+                    "point_id": recipe["recipe_id"] * len(CHUNK_FIELDS) + field_index,
+                    "field": field,
+                    "chunk_text": chunk_texts[field],
+                }
+            )
+
+    return chunks
+
+
+def index_collection_name(mode: str = INDEX_MODE) -> str:
+    return CHUNKS_COLLECTION_NAME if mode == "chunked" else COLLECTION_NAME
+
+
+def prepare_index_documents(
+    mode: str = INDEX_MODE, data_path: str = DATA_PATH
+) -> List[Dict[str, Any]]:
+    """documents to index, one per point, for an index mode"""
+    recipes_documents = prepare_recipe_documents(data_path)
+    if mode == "chunked":
+        return prepare_recipe_chunks(recipes_documents)
+    return recipes_documents
+
+
+def index_version(data_path: str = DATA_PATH, mode: str = INDEX_MODE) -> str:
+    """version of the index built from the data source with the current models
+
+    Args:
+        data_path (str, optional): path to the recipe data source. Defaults to DATA_PATH.
+        mode (str, optional): index mode. Defaults to INDEX_MODE.
+
+    Returns:
+        str: short hash of the data, the embedding models, the index mode and the points layout
+    """
+    digest = hashlib.sha256(Path(data_path).read_bytes())
+    digest.update(
+        f"{embeddings.DENSE_MODEL_NAME}|{embeddings.SPARSE_MODEL_NAME}|{mode}|{INDEX_FORMAT}".encode()
+    )
+    return digest.hexdigest()[:12]
+
+
+def build_points(
+    documents: List[Dict[str, Any]], version: Optional[str] = None
+) -> List[models.PointStruct]:
+    """embed the recipe documents (or chunks) into Qdrant points
+
+    Args:
+        documents (List[Dict[str, Any]]): prepared recipe documents or chunks
+        version (Optional[str], optional): index version stored with each point. Defaults to None.
+
+    Returns:
+        List[models.PointStruct]: points with dense and sparse vectors
+    """
+    # embed with the models of the local cache
+    dense_vectors, sparse_vectors = embeddings.embed_documents(
+        [document.get("chunk_text", document["text"]) for document in documents]
+    )
 
     # construct points
     points = []
 
-    for recipe in recipes_documents:
+    for document, dense_vector, sparse_vector in zip(
+        documents, dense_vectors, sparse_vectors
+    ):
+        payload = {field: document[field] for field in RECIPE_PAYLOAD_FIELDS}
+        if "chunk_text" in document:
+            payload["field"] = document["field"]
+            payload["chunk_text"] = document["chunk_text"]
+        payload["index_version"] = version
+
         point = models.PointStruct(
-            id=recipe["recipe_id"],
+            id=document.get("point_id", document["recipe_id"]),
             vector={
-                "jina-small": models.Document(
-                    text=recipe["text"],
-                    model="jinaai/jina-embeddings-v2-small-en",
-                ),
-                "bm25": models.Document(
-                    text=recipe["text"],
-                    model="Qdrant/bm25",
-                ),
-            },
-            payload={
-                "recipe_id": recipe["recipe_id"],
-                "text": recipe["text"],
-                "recipe_name": recipe["recipe_name"],
-                "recipe_link": recipe["recipe_link"],
-                "recipe_description": recipe["recipe_description"],
-                "ratings": recipe["ratings"],
-                "ready-in": recipe["ready-in"],
-                "directions": recipe["directions"],
-                "ingredients": recipe["ingredients"],
+                "jina-small": dense_vector,
+                "bm25": sparse_vector,
             },
+            payload=payload,
         )
         points.append(point)
 
+    return points
+
+
+def upsert_points(
+    points: List[models.PointStruct],
+    collection_name: str = COLLECTION_NAME,
+    qdrant_client: Optional[QdrantClient] = None,
+) -> None:
+    """upsert points in batches
+
+    Args:
+        points (List[models.PointStruct]): points to upsert
+        collection_name (str, optional): Qdrant collection name. Defaults to COLLECTION_NAME.
+        qdrant_client (Optional[QdrantClient], optional): client to upsert with. Defaults to the shared client.
+    """
+    qdrant_client = qdrant_client or clients.get_qdrant_client()
+    for start in range(0, len(points), UPSERT_BATCH_SIZE):
+        qdrant_client.upsert(
+            collection_name=collection_name,
+            points=points[start : start + UPSERT_BATCH_SIZE],
+        )
+
+
+def profile_digest(profile: Dict[str, Any]) -> str:
+    """short hash of the storage settings of a collection profile"""
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def versioned_collection_name(
+    alias: str, version: str, profile: Optional[Dict[str, Any]] = None
+) -> str:
+    """physical collection holding one index version stored with one profile
+
+    The alias (e.g. COLLECTION_NAME) points to the last collection initialized,
+    each version lives in its own collection and is never overwritten.
+    """
+    profile = profile or get_collection_profile()
+    return f"{alias}-{version}-{profile_digest(profile)}"
+
+
+@lru_cache(maxsize=None)
+def serving_collection_name(mode: str = INDEX_MODE) -> str:
+    """collection this process searches: its own index version, whatever the alias points to"""
+    return versioned_collection_name(
+        index_collection_name(mode), index_version(mode=mode)
+    )
+
+
+def point_alias(alias: str, collection_name: str) -> bool:
+    """atomically point the alias to the collection
+
+    Returns:
+        bool: False when a collection (not an alias) already has the alias name
+    """
+    qdrant_client = clients.get_qdrant_client()
+    aliases = {a.alias_name for a in qdrant_client.get_aliases().aliases}
+    if alias not in aliases and qdrant_client.collection_exists(alias):
+        # an index created before the versioned collections, left as it is
+        return False
+
+    operations = []
+    if alias in aliases:
+        operations.append(
+            models.DeleteAliasOperation(
+                delete_alias=models.DeleteAlias(alias_name=alias)
+            )
+        )
+    operations.append(
+        models.CreateAliasOperation(
+            create_alias=models.CreateAlias(
+                collection_name=collection_name, alias_name=alias
+            )
+        )
+    )
+    # one request: the alias never points to nothing
+    qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+    return True
+
+
+def collection_is_current(
+    version: str, expected_count: int, collection_name: str = COLLECTION_NAME
+) -> bool:
+    """whether the collection holds a complete index of the given version, stored as the current profile asks
+
+    Args:
+        version (str): expected index version
+        expected_count (int): expected number of points
+        collection_name (str, optional): Qdrant collection name. Defaults to COLLECTION_NAME.
+
+    Returns:
+        bool: True when the collection can be used as is
+    """
+    qdrant_client = clients.get_qdrant_client()
+    if not qdrant_client.collection_exists(collection_name):
+        return False
+
+    if not collection_matches_profile(get_collection_profile(), collection_name):
+        return False
+
+    points, _ = qdrant_client.scroll(
+        collection_name=collection_name, limit=1, with_payload=["index_version"]
+    )
+    if not points or points[0].payload.get("index_version") != version:
+        return False
+
+    return qdrant_client.count(collection_name, exact=True).count == expected_count
+
+
+def index_documents(
+    version: Optional[str] = None,
+    mode: str = INDEX_MODE,
+    collection_name: Optional[str] = None,
+) -> None:
+    """index the Qdrant vector DB with recipes documents
+
+    Args:
+        version (Optional[str], optional): index version stored with each point. Defaults to None.
+        mode (str, optional): index mode. Defaults to INDEX_MODE.
+        collection_name (Optional[str], optional): Qdrant collection name. Defaults to the alias of the mode.
+    """
+    documents = prepare_index_documents(mode)
+
     # upsert into DB
-    qdrant_client.upsert(collection_name=COLLECTION_NAME, points=points)
+    upsert_points(
+        build_points(documents, version),
+        collection_name or index_collection_name(mode),
+    )
@@ -0,0 +1,232 @@
+from . import metrics
+from .env import env_flag
+
+from openai import (
+    OpenAI,
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+)
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from collections import defaultdict, deque
+from dotenv import load_dotenv
+from time import monotonic, sleep
+from typing import Deque, Dict, List, Optional
+import httpx
+import os
+import random
+import threading
+
+load_dotenv()
+
+# request policy
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # seconds per llm() call
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "4"))
+LLM_HEDGE_ENABLED = env_flag("LLM_HEDGE_ENABLED")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+_openai_client: Optional[OpenAI] = None
+_openai_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=2 * LLM_POOL_SIZE)
+
+
+def _new_executor() -> None:
+    # the threads of the parent's pool do not exist in a forked worker
+    global _executor
+    _executor = ThreadPoolExecutor(max_workers=2 * LLM_POOL_SIZE)
+
+
+os.register_at_fork(after_in_child=_new_executor)
+
+_latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=500))
+_latencies_lock = threading.Lock()
+
+
+def get_openai_client() -> OpenAI:
+    """OpenAI client of the current process, created again after a fork
+
+    Returns:
+        OpenAI: client on one connection pool shared by every call, hedged or not
+    """
+    global _openai_client, _openai_pid
+    if _openai_client is None or _openai_pid != os.getpid():
+        with _client_lock:
+            if _openai_client is None or _openai_pid != os.getpid():
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=LLM_POOL_SIZE,
+                        max_keepalive_connections=LLM_POOL_SIZE,
+                    ),
+                    timeout=LLM_TIMEOUT,
+                )
+                # retries are handled by the request policy below
+                _openai_client = OpenAI(http_client=http_client, max_retries=0)
+                _openai_pid = os.getpid()
+    return _openai_client
+
+
+class LLMDeadlineExceeded(Exception):
+    """the llm call did not answer within its deadline"""
+
+
+def _record_latency(llm_model: str, latency: float) -> None:
+    with _latencies_lock:
+        _latencies[llm_model].append(latency)
+
+
+def latency_quantile(
+    llm_model: str, quantile: float, min_samples: int = LLM_HEDGE_MIN_SAMPLES
+) -> Optional[float]:
+    """latency quantile of the recent calls of a model
+
+    Args:
+        llm_model (str): llm model
+        quantile (float): quantile, between 0 and 1
+        min_samples (int, optional): calls needed for an estimate. Defaults to LLM_HEDGE_MIN_SAMPLES.
+
+    Returns:
+        Optional[float]: latency in seconds, None until enough calls were observed
+    """
+    with _latencies_lock:
+        samples = sorted(_latencies[llm_model])
+
+    if len(samples) < min_samples:
+        return None
+
+    index = min(len(samples) - 1, int(quantile * len(samples)))
+    return samples[index]
+
+
+def hedge_delay(llm_model: str) -> Optional[float]:
+    """delay after which a second request is fired
+
+    Args:
+        llm_model (str): llm model
+
+    Returns:
+        Optional[float]: the LLM_HEDGE_QUANTILE latency of the recent calls, None until enough calls were observed
+    """
+    delay = latency_quantile(llm_model, LLM_HEDGE_QUANTILE)
+    if delay is None:
+        return None
+    return max(LLM_HEDGE_MIN_DELAY, delay)
+
+
+def _timed_call(llm_model: str, messages: List[Dict[str, str]], timeout: float):
+    start_time = monotonic()
+    try:
+        return get_openai_client().chat.completions.create(
+            model=llm_model, messages=messages, timeout=timeout
+        )
+    finally:
+        # failed, timed-out and cancelled attempts count too, or the quantiles
+        # would only see the calls fast enough to succeed
+        _record_latency(llm_model, min(monotonic() - start_time, timeout))
+
+
+def _with_loser_usage(response, loser: Future):
+    """response whose usage also counts the losing hedged request
+
+    A request cannot be cancelled once sent and OpenAI bills the loser too. Its
+    usage is added when it has already answered, and estimated as the winner's
+    (same prompt and model) while it still runs. A failed loser adds nothing.
+    """
+    if response.usage is None:
+        return response
+    if loser.done():
+        if loser.exception() is not None or loser.result().usage is None:
+            return response
+        loser_usage = loser.result().usage
+    else:
+        loser_usage = response.usage
+
+    usage = response.usage.model_copy(
+        update={
+            field: getattr(response.usage, field) + getattr(loser_usage, field)
+            for field in ("prompt_tokens", "completion_tokens", "total_tokens")
+        }
+    )
+    return response.model_copy(update={"usage": usage})
+
+
+def _hedged_call(llm_model: str, messages: List[Dict[str, str]], timeout: float):
+    delay = hedge_delay(llm_model) if LLM_HEDGE_ENABLED else None
+    if delay is None or delay >= timeout:
+        return _timed_call(llm_model, messages, timeout)
+
+    first = _executor.submit(_timed_call, llm_model, messages, timeout)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    metrics.increment("llm_hedges_fired")
+    second = _executor.submit(_timed_call, llm_model, messages, timeout - delay)
+
+    # whichever answers first wins, an error only counts if both fail
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    metrics.increment("llm_hedges_won")
+                return _with_loser_usage(
+                    future.result(), first if future is second else second
+                )
+            error = future.exception()
+    raise error
+
+
+def chat_completion(
+    llm_model: str, messages: List[Dict[str, str]], timeout: Optional[float] = None
+):
+    """call the chat completions API with a deadline, retries and optional hedging
+
+    Args:
+        llm_model (str): llm model
+        messages (List[Dict[str, str]]): chat messages
+        timeout (Optional[float], optional): deadline in seconds for the call including its retries. Defaults to LLM_TIMEOUT.
+
+    Raises:
+        LLMDeadlineExceeded: no answer before the deadline
+
+    Returns:
+        ChatCompletion: the first successful response, its usage counting both requests when hedged
+    """
+    deadline = monotonic() + (LLM_TIMEOUT if timeout is None else timeout)
+    metrics.increment("llm_calls")
+
+    attempt = 0
+    while True:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            metrics.increment("llm_deadline_exceeded")
+            raise LLMDeadlineExceeded(f"{llm_model} did not answer in time")
+
+        try:
+            return _hedged_call(llm_model, messages, remaining)
+        except RETRYABLE_ERRORS as e:
+            # full jitter backoff, never sleeping past the deadline
+            backoff = random.uniform(
+                0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2**attempt)
+            )
+            if attempt >= LLM_MAX_RETRIES or monotonic() + backoff >= deadline:
+                if deadline - monotonic() <= 0:
+                    metrics.increment("llm_deadline_exceeded")
+                    raise LLMDeadlineExceeded(
+                        f"{llm_model} did not answer in time"
+                    ) from e
+                raise
+            attempt += 1
+            metrics.increment("llm_retries")
+            sleep(backoff)
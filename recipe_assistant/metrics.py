@@ -0,0 +1,35 @@
+from collections import defaultdict
+from typing import Dict
+import threading
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+
+
+def increment(name: str, value: float = 1) -> None:
+    """increase a monotonic counter
+
+    Args:
+        name (str): counter name
+        value (float, optional): increment. Defaults to 1.
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name: str, value: float) -> None:
+    """set a gauge to its current value
+
+    Args:
+        name (str): gauge name
+        value (float): current value
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """current value of every counter and gauge"""
+    with _lock:
+        return {"counters": dict(_counters), "gauges": dict(_gauges)}
@@ -0,0 +1,85 @@
+import argparse
+import json
+import re
+import time
+import uuid
+from typing import Dict, List
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+# minimal OpenAI-compatible chat completions endpoint, to run the evaluation
+# and load tests offline: OPENAI_BASE_URL=http://localhost:8001/v1
+app = FastAPI(title="OpenAI stub")
+
+# simulated latency of a completion, in seconds
+LATENCY = 0.0
+
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str
+    messages: List[ChatMessage]
+
+
+def _count_tokens(text: str) -> int:
+    return len(text.split())
+
+
+def stub_answer(prompt: str) -> str:
+    """deterministic answer: a verdict for the judge, the first recipe of the context otherwise"""
+    if "expert evaluator" in prompt:
+        return json.dumps(
+            {"Relevance": "RELEVANT", "Explanation": "Stub evaluation of the answer."}
+        )
+
+    match = re.search(r"Recipe: ([^|\n]+)", prompt)
+    if match:
+        return f"You could make {match.group(1).strip()}."
+    return "I could not find a matching recipe."
+
+
+@app.post("/v1/chat/completions")
+def chat_completions(request: ChatCompletionRequest) -> Dict:
+    if LATENCY:
+        time.sleep(LATENCY)
+
+    prompt = "\n".join(message.content for message in request.messages)
+    answer = stub_answer(prompt)
+    prompt_tokens = _count_tokens(prompt)
+    completion_tokens = _count_tokens(answer)
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    args = parser.parse_args()
+
+    LATENCY = args.latency
+    uvicorn.run(app, host="0.0.0.0", port=args.port)
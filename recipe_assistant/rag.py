@@ -1,65 +1,277 @@
 from . import ingest
+from . import clients
+from . import index_artifact
+from . import embeddings
+from . import llm_client
+from . import metrics
+from . import relevance as local_relevance
+from . import routing
+from . import sessions
+from .env import env_flag
 
 from qdrant_client import QdrantClient, models
 
 from dotenv import load_dotenv
-from openai import OpenAI
-from typing import List, Dict, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from functools import partial
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+import math
 import os
 from time import time
 import json
+import threading
 
 # preparation
 load_dotenv()
-openai_client = OpenAI()
 
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-qdrant_client = QdrantClient(QDRANT_URL)
+# search parameters of the collection profile the collection was created with
+SEARCH_PARAMS = ingest.search_params(ingest.get_collection_profile())
+
+# named settings of the hybrid query, extended by the file written by benchmarks.sweep
+SEARCH_PROFILES = {
+    "default": {"mode": "hybrid", "fusion": "rrf", "prefetch_multiplier": 5},
+    "dense": {"mode": "dense", "fusion": "rrf", "prefetch_multiplier": 5},
+    "sparse": {"mode": "sparse", "fusion": "rrf", "prefetch_multiplier": 5},
+}
+SEARCH_PROFILES_PATH = Path(
+    os.getenv(
+        "SEARCH_PROFILES_PATH", ingest.project_root / "data" / "search-profiles.json"
+    )
+)
+SEARCH_PROFILE = os.getenv("SEARCH_PROFILE", "default")
+
+# answer cache: 0 disables it
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+_answer_cache: "OrderedDict[Tuple[str, str, int], Dict]" = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+# LLM judge of the answer relevance
+EVAL_MODEL = "gpt-4o-mini"
+
+# latency budget of rag(): share given to retrieval, minimum time worth starting a stage
+RETRIEVAL_BUDGET_SHARE = float(os.getenv("RETRIEVAL_BUDGET_SHARE", "0.25"))
+# share of the retrieval budget the hybrid search may take, the sparse fallback gets the rest
+HYBRID_SEARCH_SHARE = float(os.getenv("HYBRID_SEARCH_SHARE", "0.8"))
+MIN_GENERATION_TIME = float(os.getenv("MIN_GENERATION_TIME", "1.0"))
+MIN_EVALUATION_TIME = float(os.getenv("MIN_EVALUATION_TIME", "1.0"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "8"))
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+# hybrid searches running or queued, beyond it the sparse search runs directly
+SEARCH_QUEUE_SIZE = int(os.getenv("SEARCH_QUEUE_SIZE", str(2 * SEARCH_WORKERS)))
+_search_slots = threading.BoundedSemaphore(SEARCH_QUEUE_SIZE)
+
+
+def _new_search_executor() -> None:
+    # the threads of the parent's pool do not exist in a forked worker
+    global _search_executor, _search_slots
+    _search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+    _search_slots = threading.BoundedSemaphore(SEARCH_QUEUE_SIZE)
+
+
+os.register_at_fork(after_in_child=_new_search_executor)
+
+# chunked index: put only the matching chunks of a recipe in the prompt
+PROMPT_CHUNKS_ONLY = env_flag("PROMPT_CHUNKS_ONLY", default=True)
 
 
 def init_qdrant():
-    """Initialize and index documents in Qdrant"""
-    ingest.create_qdrant_collection()
-    ingest.index_documents()
+    """Initialize and index documents in Qdrant
+
+    Each index version (and collection profile) lives in its own collection, so
+    replicas starting together or a rolling deploy never delete a collection that
+    is being served. A missing or incomplete collection is created and filled with
+    an idempotent upsert, from the prebuilt index artifact when there is one and
+    by embedding the recipes when there is none. The alias is then pointed to it.
+    Collections of older versions are kept, see the README to remove them.
+    """
+    alias = ingest.index_collection_name()
+    version = ingest.index_version()
+    collection_name = ingest.serving_collection_name()
+    expected_count = len(ingest.prepare_index_documents())
 
+    if ingest.collection_is_current(version, expected_count, collection_name):
+        print(f"Qdrant collection {collection_name} is up to date")
+    else:
+        # create-if-missing and upsert: concurrent replicas write the same points
+        ingest.create_qdrant_collection(collection_name)
+        artifact = index_artifact.find_artifact(version)
+        if artifact is not None:
+            print(f"Restoring the Qdrant collection {collection_name} from {artifact}")
+            ingest.upsert_points(index_artifact.load_points(artifact), collection_name)
+        else:
+            print(
+                f"No index artifact found, embedding the recipes into {collection_name}"
+            )
+            ingest.index_documents(version, collection_name=collection_name)
 
-def qdrant_rrf_search(
-    query, collection_name="recipe-rag-hybrid", limit=5
+    if not ingest.point_alias(alias, collection_name):
+        print(f"A collection named {alias} exists, the alias was not created")
+
+
+def load_search_profiles(path: Path = SEARCH_PROFILES_PATH) -> Dict[str, Dict]:
+    profiles = dict(SEARCH_PROFILES)
+    if path.exists():
+        with open(path) as f:
+            profiles.update(json.load(f))
+    return profiles
+
+
+def get_search_profile(name: Optional[str] = None) -> Dict:
+    """settings of the hybrid query
+
+    Args:
+        name (Optional[str], optional): search profile name. Defaults to SEARCH_PROFILE.
+
+    Returns:
+        Dict: mode ("hybrid", "dense" or "sparse"), fusion ("rrf" or "dbsf") and prefetch_multiplier
+
+    Raises:
+        ValueError: unknown profile, or a profile with an unknown mode or fusion
+    """
+    name = name or SEARCH_PROFILE
+    profiles = search_profiles
+    if name not in profiles:
+        raise ValueError(
+            f"Unknown search profile: {name}, choose from {sorted(profiles)}"
+        )
+    profile = {**SEARCH_PROFILES["default"], **profiles[name]}
+    if profile["mode"] not in SEARCH_MODES or profile["fusion"] not in FUSIONS:
+        raise ValueError(f"Invalid search profile {name}: {profile}")
+    return profile
+
+
+FUSIONS = {"rrf": models.Fusion.RRF, "dbsf": models.Fusion.DBSF}
+SEARCH_MODES = ("hybrid", "dense", "sparse")
+
+# read once, the profiles file is only written offline
+search_profiles = load_search_profiles()
+# fail at startup, not on the first question, on a misspelled SEARCH_PROFILE
+get_search_profile()
+
+
+def rrf_query_points(
+    dense_vector: List[float],
+    sparse_vector: models.SparseVector,
+    collection_name: str = "recipe-rag-hybrid",
+    limit: int = 5,
+    search_params: Optional[models.SearchParams] = None,
+    qdrant_client: Optional[QdrantClient] = None,
+    mode: str = "hybrid",
+    fusion: str = "rrf",
+    prefetch_multiplier: int = 5,
 ) -> List[models.ScoredPoint]:
-    """rrf search for our rag
+    """hybrid query with already embedded vectors, fused with rrf (or dbsf)
 
     Args:
-        query (_type_): user query
+        dense_vector (List[float]): dense query vector
+        sparse_vector (models.SparseVector): sparse query vector
         collection_name (str, optional): Qdrant collection name. Defaults to "recipe-rag-hybrid".
         limit (int, optional): results returned. Defaults to 5.
+        search_params (Optional[models.SearchParams], optional): search parameters of the dense vectors. Defaults to None.
+        qdrant_client (Optional[QdrantClient], optional): client to query with. Defaults to the shared client.
+        mode (str, optional): "hybrid", or "dense" / "sparse" for a single branch. Defaults to "hybrid".
+        fusion (str, optional): "rrf" or "dbsf" fusion of the hybrid branches. Defaults to "rrf".
+        prefetch_multiplier (int, optional): candidates of each hybrid branch, per result. Defaults to 5.
 
     Returns:
-        List[models.ScoredPoint]: _description_
+        List[models.ScoredPoint]: scored points with their payload
     """
+    qdrant_client = qdrant_client or clients.get_qdrant_client()
+
+    if mode == "dense":
+        query = {
+            "query": dense_vector,
+            "using": "jina-small",
+            "search_params": search_params,
+        }
+    elif mode == "sparse":
+        query = {"query": sparse_vector, "using": "bm25"}
+    else:
+        query = {
+            "prefetch": [
+                models.Prefetch(
+                    query=dense_vector,
+                    using="jina-small",
+                    limit=(prefetch_multiplier * limit),
+                    params=search_params,
+                ),
+                models.Prefetch(
+                    query=sparse_vector,
+                    using="bm25",
+                    limit=(prefetch_multiplier * limit),
+                ),
+            ],
+            # Fusion query enables fusion on the prefetched results
+            "query": models.FusionQuery(fusion=FUSIONS[fusion]),
+        }
 
     query_points = qdrant_client.query_points(
         collection_name=collection_name,
-        prefetch=[
-            models.Prefetch(
-                query=models.Document(
-                    text=query,
-                    model="jinaai/jina-embeddings-v2-small-en",
-                ),
-                using="jina-small",
-                limit=(5 * limit),
-            ),
-            models.Prefetch(
-                query=models.Document(
-                    text=query,
-                    model="Qdrant/bm25",
-                ),
-                using="bm25",
-                limit=(5 * limit),
-            ),
-        ],
-        # Fusion query enables fusion on the prefetched results
-        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=limit,
         with_payload=True,
+        **query,
+    )
+    return query_points.points
+
+
+def qdrant_rrf_search(
+    query, collection_name=None, limit=5, search_profile=None
+) -> List[models.ScoredPoint]:
+    """rrf search for our rag
+
+    Args:
+        query (_type_): user query
+        collection_name (str, optional): Qdrant collection name. Defaults to the collection of the current index version.
+        limit (int, optional): results returned. Defaults to 5.
+        search_profile (Optional[str], optional): name of the search profile. Defaults to SEARCH_PROFILE.
+
+    Returns:
+        List[models.ScoredPoint]: payloads of the matching recipes
+    """
+    profile = get_search_profile(search_profile)
+
+    # a single-branch profile only needs one embedding
+    points = rrf_query_points(
+        None if profile["mode"] == "sparse" else embeddings.dense_query_vector(query),
+        None if profile["mode"] == "dense" else embeddings.sparse_query_vector(query),
+        collection_name=collection_name or ingest.serving_collection_name(),
+        limit=limit,
+        search_params=SEARCH_PARAMS,
+        mode=profile["mode"],
+        fusion=profile["fusion"],
+        prefetch_multiplier=profile["prefetch_multiplier"],
+    )
+
+    results = []
+    for point in points:
+        results.append(point.payload)
+    return results
+
+
+def qdrant_sparse_search(
+    query, collection_name=None, limit=5, timeout=None
+) -> List[models.ScoredPoint]:
+    """sparse-only (bm25) search, cheap enough to be the fallback of the hybrid search
+
+    Args:
+        query (_type_): user query
+        collection_name (str, optional): Qdrant collection name. Defaults to the collection of the current index version.
+        limit (int, optional): results returned. Defaults to 5.
+        timeout (Optional[int], optional): seconds Qdrant may take. Defaults to None (the client timeout).
+
+    Returns:
+        List[models.ScoredPoint]: payloads of the matching recipes
+    """
+
+    query_points = clients.get_qdrant_client().query_points(
+        collection_name=collection_name or ingest.serving_collection_name(),
+        query=embeddings.sparse_query_vector(query),
+        using="bm25",
+        limit=limit,
+        with_payload=True,
+        timeout=timeout,
     )
 
     results = []
@@ -68,18 +280,231 @@ def qdrant_rrf_search(
     return results
 
 
-def llm(prompt: str, llm_model: str) -> Tuple[str, Dict[str, int]]:
+def merge_chunk_hits(hits: List[models.ScoredPoint]) -> Dict:
+    """one recipe result out of its matching chunks, best chunk first"""
+    result = {
+        key: value
+        for key, value in hits[0].payload.items()
+        if key not in ("field", "chunk_text")
+    }
+    result["chunks"] = [
+        {"field": hit.payload["field"], "text": hit.payload["chunk_text"]}
+        for hit in hits
+    ]
+    return result
+
+
+def chunk_query_groups(
+    dense_vector: Optional[List[float]],
+    sparse_vector: Optional[models.SparseVector],
+    collection_name: str = ingest.CHUNKS_COLLECTION_NAME,
+    limit: int = 5,
+    search_params: Optional[models.SearchParams] = None,
+    qdrant_client: Optional[QdrantClient] = None,
+    timeout: Optional[int] = None,
+    mode: str = "hybrid",
+    fusion: str = "rrf",
+    prefetch_multiplier: int = 5,
+) -> List[Dict]:
+    """query the chunks and group them per recipe
+
+    Each recipe is ranked by its best chunk, and keeps its other matching chunks.
+
+    Args:
+        dense_vector (Optional[List[float]]): dense query vector, None for a sparse-only query
+        sparse_vector (Optional[models.SparseVector]): sparse query vector, None for a dense-only query
+        collection_name (str, optional): Qdrant collection name. Defaults to ingest.CHUNKS_COLLECTION_NAME.
+        limit (int, optional): recipes returned. Defaults to 5.
+        search_params (Optional[models.SearchParams], optional): search parameters of the dense vectors. Defaults to None.
+        qdrant_client (Optional[QdrantClient], optional): client to query with. Defaults to the shared client.
+        timeout (Optional[int], optional): seconds Qdrant may take. Defaults to None (the client timeout).
+        mode (str, optional): "hybrid", or "dense" / "sparse" for a single branch. Defaults to "hybrid".
+        fusion (str, optional): "rrf" or "dbsf" fusion of the hybrid branches. Defaults to "rrf".
+        prefetch_multiplier (int, optional): chunks of each hybrid branch, per chunk returned. Defaults to 5.
+
+    Returns:
+        List[Dict]: payloads of the matching recipes with their matching chunks
+    """
+    qdrant_client = qdrant_client or clients.get_qdrant_client()
+    group_size = len(ingest.CHUNK_FIELDS)
+
+    if mode == "sparse" or dense_vector is None:
+        query = {"query": sparse_vector, "using": "bm25"}
+    elif mode == "dense":
+        query = {
+            "query": dense_vector,
+            "using": "jina-small",
+            "search_params": search_params,
+        }
+    else:
+        # enough chunks per branch to still fill the groups after grouping
+        prefetch_limit = prefetch_multiplier * limit * group_size
+        query = {
+            "prefetch": [
+                models.Prefetch(
+                    query=dense_vector,
+                    using="jina-small",
+                    limit=prefetch_limit,
+                    params=search_params,
+                ),
+                models.Prefetch(
+                    query=sparse_vector,
+                    using="bm25",
+                    limit=prefetch_limit,
+                ),
+            ],
+            "query": models.FusionQuery(fusion=FUSIONS[fusion]),
+        }
+
+    groups = qdrant_client.query_points_groups(
+        collection_name=collection_name,
+        group_by="recipe_id",
+        limit=limit,
+        group_size=group_size,
+        with_payload=True,
+        timeout=timeout,
+        **query,
+    ).groups
+
+    return [merge_chunk_hits(group.hits) for group in groups]
+
+
+def qdrant_chunk_search(
+    query: str,
+    collection_name: Optional[str] = None,
+    limit: int = 5,
+    sparse_only: bool = False,
+    timeout: Optional[int] = None,
+    search_profile: Optional[str] = None,
+) -> List[Dict]:
+    """search of the chunked index, aggregated per recipe
+
+    Args:
+        query (str): user query
+        collection_name (Optional[str], optional): Qdrant collection name. Defaults to the collection of the current index version.
+        limit (int, optional): recipes returned. Defaults to 5.
+        sparse_only (bool, optional): bm25 only, the fallback of the hybrid search. Defaults to False.
+        timeout (Optional[int], optional): seconds Qdrant may take. Defaults to None (the client timeout).
+        search_profile (Optional[str], optional): name of the search profile. Defaults to SEARCH_PROFILE.
+
+    Returns:
+        List[Dict]: payloads of the matching recipes with their matching chunks
+    """
+    profile = get_search_profile(search_profile)
+    mode = "sparse" if sparse_only else profile["mode"]
+
+    # a single-branch search only needs one embedding
+    return chunk_query_groups(
+        None if mode == "sparse" else embeddings.dense_query_vector(query),
+        None if mode == "dense" else embeddings.sparse_query_vector(query),
+        collection_name=collection_name or ingest.serving_collection_name(),
+        limit=limit,
+        search_params=SEARCH_PARAMS,
+        timeout=timeout,
+        mode=mode,
+        fusion=profile["fusion"],
+        prefetch_multiplier=profile["prefetch_multiplier"],
+    )
+
+
+def fetch_recipes(
+    recipe_ids: List[int],
+    collection_name: Optional[str] = None,
+    mode: str = ingest.INDEX_MODE,
+    timeout: Optional[int] = None,
+) -> List[Dict]:
+    """payloads of recipes by id, e.g. the recipes of a conversation
+
+    Args:
+        recipe_ids (List[int]): recipe ids
+        collection_name (Optional[str], optional): Qdrant collection name. Defaults to the collection of the current index version.
+        mode (str, optional): index mode of the collection. Defaults to ingest.INDEX_MODE.
+        timeout (Optional[int], optional): seconds Qdrant may take. Defaults to None (the client timeout).
+
+    Returns:
+        List[Dict]: payloads of the recipes still in the index, in the order of recipe_ids
+    """
+    # every chunk carries the whole recipe, the first one (description) is enough
+    chunks = len(ingest.CHUNK_FIELDS) if mode == "chunked" else 1
+    points = clients.get_qdrant_client().retrieve(
+        collection_name=collection_name or ingest.serving_collection_name(mode),
+        ids=[recipe_id * chunks for recipe_id in recipe_ids],
+        with_payload=True,
+        timeout=timeout,
+    )
+
+    payloads = {
+        point.payload["recipe_id"]: {
+            key: value
+            for key, value in point.payload.items()
+            if key not in ("field", "chunk_text")
+        }
+        for point in points
+    }
+    return [payloads[recipe_id] for recipe_id in recipe_ids if recipe_id in payloads]
+
+
+def retrieve(query: str, limit: int = 5, timeout: Optional[float] = None) -> List[Dict]:
+    """hybrid search, falling back to the sparse-only search when it is too slow
+
+    The hybrid search gets HYBRID_SEARCH_SHARE of the budget, and the sparse
+    search what is left of it. When SEARCH_QUEUE_SIZE hybrid searches are
+    already running or queued, the sparse search runs directly.
+
+    Args:
+        query (str): user query
+        limit (int, optional): results returned. Defaults to 5.
+        timeout (Optional[float], optional): seconds the retrieval may take. Defaults to None (no limit).
+
+    Returns:
+        List[Dict]: payloads of the matching recipes
+    """
+    if ingest.INDEX_MODE == "chunked":
+        search = qdrant_chunk_search
+        sparse_search = partial(qdrant_chunk_search, sparse_only=True)
+    else:
+        search = qdrant_rrf_search
+        sparse_search = qdrant_sparse_search
+
+    if timeout is None:
+        return search(query, limit=limit)
+
+    start_time = time()
+    if not _search_slots.acquire(blocking=False):
+        metrics.increment("retrieval_search_saturated")
+        return sparse_search(query, limit=limit, timeout=max(1, math.ceil(timeout)))
+
+    future = _search_executor.submit(search, query, limit=limit)
+    # a cancelled future runs its callbacks too
+    future.add_done_callback(lambda _: _search_slots.release())
+    try:
+        return future.result(timeout=timeout * HYBRID_SEARCH_SHARE)
+    except FuturesTimeoutError:
+        # only a search still queued can be cancelled, a running one finishes
+        future.cancel()
+        metrics.increment("retrieval_sparse_fallbacks")
+        # Qdrant takes whole seconds
+        remaining_time = timeout - (time() - start_time)
+        return sparse_search(
+            query, limit=limit, timeout=max(1, math.ceil(remaining_time))
+        )
+
+
+def llm(
+    prompt: str, llm_model: str, timeout: Optional[float] = None
+) -> Tuple[str, Dict[str, int]]:
     """generating the answer using the llm after the retreival
 
     Args:
         prompt (str): prompt
         llm_model (str): llm model
+        timeout (Optional[float], optional): deadline of the call in seconds. Defaults to the request policy timeout.
 
     Returns:
         Tuple[str, Dict[str, int]]:: generated answer, and the stats of the token for the llm usage
     """
-    response = openai_client.chat.completions.create(
-        model=llm_model, messages=[{"role": "user", "content": prompt}]
+    response = llm_client.chat_completion(
+        llm_model, messages=[{"role": "user", "content": prompt}], timeout=timeout
     )
 
     answer = response.choices[0].message.content
@@ -92,12 +517,17 @@ def llm(prompt: str, llm_model: str) -> Tuple[str, Dict[str, int]]:
     return answer, token_stats
 
 
-def build_prompt(query: str, search_results: List[models.ScoredPoint]) -> str:
+def build_prompt(
+    query: str,
+    search_results: List[models.ScoredPoint],
+    chunks_only: bool = PROMPT_CHUNKS_ONLY,
+    history: Optional[List[Dict[str, str]]] = None,
+) -> str:
     prompt_template = """
 You're a cooking assistant. Answer the QUESTION based on the CONTEXT from the recipe database.
 Use only the facts from the CONTEXT when answering the QUESTION.
 
-QUESTION: {question}
+{history}QUESTION: {question}
 
 CONTEXT: 
 {context}
@@ -106,15 +536,25 @@ CONTEXT:
     context = ""
 
     for doc in search_results:
-        context = (
-            context + f"{doc['text']}\n\n"
-        )  # doc['text'] should contain all the recipe information
-
-    prompt = prompt_template.format(question=query, context=context).strip()
+        # only the fields of the recipe that matched the query, in chunked mode
+        doc_text = local_relevance.document_text(doc, chunks_only)
+        context = context + f"{doc_text}\n\n"
+
+    history_text = ""
+    if history:
+        # previous turns of a follow-up question
+        history_text = "The QUESTION follows up on this CONVERSATION:\n"
+        for turn in history:
+            history_text += f"Q: {turn['question']}\nA: {turn['answer']}\n"
+        history_text += "\n"
+
+    prompt = prompt_template.format(
+        history=history_text, question=query, context=context
+    ).strip()
     return prompt
 
 
-def evalualte_relevance(question, answer):
+def evalualte_relevance(question, answer, timeout=None):
     evaluation_prompt_template = """
     You are an expert evaluator for a RAG system.
     Your task is to analyze the relevance of the generated answer to the given question.
@@ -136,7 +576,7 @@ def evalualte_relevance(question, answer):
     """.strip()
 
     prompt = evaluation_prompt_template.format(question=question, answer=answer)
-    evaluation, tokens = llm(prompt, llm_model="gpt-4o-mini")
+    evaluation, tokens = llm(prompt, llm_model=EVAL_MODEL, timeout=timeout)
 
     try:
         json_eval = json.loads(evaluation)
@@ -173,29 +613,373 @@ def calculate_openai_cost(model, tokens):
     return openai_cost
 
 
-def rag(query: str, llm_model: str = "gpt-4o-mini", limit: int = 5) -> str:
+def _answer_cache_key(query: str, llm_model: str, limit: int) -> Tuple[str, str, int]:
+    return " ".join(query.lower().split()), llm_model, limit
+
+
+def get_cached_answer(query: str, llm_model: str, limit: int) -> Optional[Dict]:
+    """look up a previously generated answer
+
+    Args:
+        query (str): user query
+        llm_model (str): llm model
+        limit (int): number of retrieved recipes
+
+    Returns:
+        Optional[Dict]: the cached answer data, None on a miss
+    """
+    if ANSWER_CACHE_SIZE <= 0:
+        return None
+
+    key = _answer_cache_key(query, llm_model, limit)
+    with _answer_cache_lock:
+        answer_data = _answer_cache.get(key)
+        if answer_data is not None:
+            _answer_cache.move_to_end(key)
+    return answer_data
+
+
+def cache_answer(query: str, llm_model: str, limit: int, answer_data: Dict) -> None:
+    """store a generated answer, evicting the least recently used one when full"""
+    if ANSWER_CACHE_SIZE <= 0:
+        return
+
+    key = _answer_cache_key(query, llm_model, limit)
+    with _answer_cache_lock:
+        _answer_cache[key] = answer_data
+        _answer_cache.move_to_end(key)
+        while len(_answer_cache) > ANSWER_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+
+def answer_cache_info() -> Dict[str, int]:
+    with _answer_cache_lock:
+        return {"size": len(_answer_cache), "maxsize": ANSWER_CACHE_SIZE}
+
+
+def fallback_answer(search_results: List[Dict]) -> Tuple[str, List[Dict[str, str]]]:
+    """answer made of the retrieved recipes, used when the llm cannot answer in time
+
+    Args:
+        search_results (List[Dict]): retrieved recipes
+
+    Returns:
+        Tuple[str, List[Dict[str, str]]]: answer text, and the recipe name, link and ready-in of each recipe
+    """
+    recipes = [
+        {
+            "recipe_name": doc["recipe_name"],
+            "recipe_link": doc["recipe_link"],
+            "ready_in": doc["ready-in"],
+        }
+        for doc in search_results
+    ]
+
+    lines = [
+        "We could not generate an answer in time. These recipes match your question:"
+    ]
+    for recipe in recipes:
+        lines.append(
+            f"- {recipe['recipe_name']} (ready in {recipe['ready_in']}): {recipe['recipe_link']}"
+        )
+    return "\n".join(lines), recipes
+
+
+def _fallback_answer_data(
+    llm_model: str,
+    search_results: List[Dict],
+    start_time: float,
+    reason: str,
+    routing_decision: str = "manual",
+) -> Dict:
+    metrics.increment("rag_fallback_answers")
+    answer_text, recipes = fallback_answer(search_results)
+    return {
+        "answer": answer_text,
+        "model_used": llm_model,
+        "response_time": time() - start_time,
+        "relevance": "UNKNOWN",
+        "relevance_explanation": reason,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "eval_prompt_tokens": 0,
+        "eval_completion_tokens": 0,
+        "eval_total_tokens": 0,
+        "openai_cost": 0.0,
+        "routing_decision": routing_decision,
+        "cache_hit": False,
+        "fallback": recipes,
+    }
+
+
+def estimated_call_cost(llm_model: str, prompt: str) -> Optional[float]:
+    """cost of a call before making it, with about 4 characters per prompt token"""
+    return calculate_openai_cost(
+        llm_model,
+        {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": routing.ROUTING_EXPECTED_COMPLETION_TOKENS,
+        },
+    )
+
+
+def fits_budget(
+    llm_model: str,
+    prompt: str,
+    remaining_time: Optional[float],
+    remaining_cost: Optional[float],
+) -> bool:
+    """whether a call to the model is expected to fit the time and money left
+
+    Args:
+        llm_model (str): llm model
+        prompt (str): prompt
+        remaining_time (Optional[float]): seconds left, None for no limit
+        remaining_cost (Optional[float]): dollars left, None for no limit
+
+    Returns:
+        bool: True when the median latency and the estimated cost fit
+    """
+    if remaining_cost is not None:
+        cost = estimated_call_cost(llm_model, prompt)
+        if cost is None or cost > remaining_cost:
+            return False
+
+    if remaining_time is not None:
+        latency = llm_client.latency_quantile(llm_model, 0.5)
+        if latency is None:
+            latency = routing.ROUTING_DEFAULT_LATENCY
+        if max(latency, MIN_GENERATION_TIME) > remaining_time:
+            return False
+
+    return True
+
+
+def route_model(
+    query: str,
+    search_results: List[Dict],
+    prompt: str,
+    remaining_time: Optional[float],
+    remaining_cost: Optional[float],
+) -> Tuple[str, str]:
+    """first model of an auto request
+
+    Returns:
+        Tuple[str, str]: llm model, routing decision. A "fallback:over_budget"
+        decision means that not even the cheap model fits the cost budget.
+    """
+    # the latency of the cheap model is checked by rag() like any other call
+    cheap_fits = fits_budget(routing.ROUTING_CHEAP_MODEL, prompt, None, remaining_cost)
+    if routing.is_simple_question(query, search_results):
+        if cheap_fits:
+            return routing.ROUTING_CHEAP_MODEL, "cheap:simple"
+    elif fits_budget(
+        routing.ROUTING_STRONG_MODEL, prompt, remaining_time, remaining_cost
+    ):
+        return routing.ROUTING_STRONG_MODEL, "strong:complex"
+    elif cheap_fits:
+        return routing.ROUTING_CHEAP_MODEL, "cheap:over_budget"
+    return routing.ROUTING_CHEAP_MODEL, "fallback:over_budget"
+
+
+def rag(
+    query: str,
+    llm_model: str = "gpt-4o-mini",
+    limit: int = 5,
+    deadline: Optional[float] = None,
+    max_cost: Optional[float] = None,
+    conversation_id: Optional[str] = None,
+    parent_id: Optional[str] = None,
+) -> Dict:
     """llm generating the answer from the prompt
 
     Args:
         query (str): user query
         llm_model (str, optional): llm model used. Defaults to "gpt-4o-mini".
+        limit (int, optional): number of retrieved recipes. Defaults to 5.
+        deadline (Optional[float], optional): latency budget in seconds, spread over retrieval, generation and evaluation. Defaults to None (no budget).
+        max_cost (Optional[float], optional): generation budget in dollars of an "auto" request. Defaults to ROUTING_MAX_COST.
+        conversation_id (Optional[str], optional): id under which follow-ups find this conversation. Defaults to None (not kept).
+        parent_id (Optional[str], optional): conversation this question follows up on. Defaults to None.
 
     Returns:
-        str: llm generated answer
+        Dict: llm generated answer and its stats. When generation cannot finish within the budget, the answer lists the retrieved recipes, also returned under "fallback".
     """
     start_time = time()
 
-    search_results = qdrant_rrf_search(query, limit=limit)
-    prompt = build_prompt(query, search_results)
-    answer_text, token_stats = llm(prompt, llm_model)
+    def remaining() -> Optional[float]:
+        if deadline is None:
+            return None
+        return start_time + deadline - time()
+
+    # a follow-up reuses the recipes of its conversation, unless it changed topic
+    parent = sessions.store.get(parent_id) if parent_id else None
+    follow_up = False
+    if parent is not None:
+        follow_up = not sessions.topic_changed(query, parent)
+        metrics.increment(
+            "session_follow_ups" if follow_up else "session_topic_changes"
+        )
+    elif parent_id:
+        metrics.increment("session_misses")
+
+    def remember(answer_text: str, search_results: List[Dict]) -> None:
+        if conversation_id:
+            sessions.store.put(
+                conversation_id,
+                sessions.new_session(
+                    query, answer_text, search_results, parent if follow_up else None
+                ),
+            )
+
+    # the answer to a follow-up depends on the conversation, it is not cached
+    # the cache is keyed on the model asked for, "auto" before routing
+    requested_model = llm_model
+    cached = None if follow_up else get_cached_answer(query, requested_model, limit)
+    if cached is not None:
+        cached = dict(cached)
+        remember(cached["answer"], cached.pop("search_results"))
+        # a cache hit costs no tokens
+        return {
+            **cached,
+            "response_time": time() - start_time,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "eval_prompt_tokens": 0,
+            "eval_completion_tokens": 0,
+            "eval_total_tokens": 0,
+            "openai_cost": 0.0,
+            "cache_hit": True,
+        }
+
+    retrieval_timeout = None if deadline is None else deadline * RETRIEVAL_BUDGET_SHARE
+    if follow_up:
+        # the session only keeps the recipe ids, a lookup by id is cheaper than a search
+        search_results = fetch_recipes(
+            parent["recipe_ids"],
+            timeout=(
+                None
+                if retrieval_timeout is None
+                else max(1, math.ceil(retrieval_timeout))
+            ),
+        )
+        # recipes gone from a new index version: search again
+        follow_up = bool(search_results)
+
+    if follow_up:
+        # the chunks matched the first question, a follow-up gets whole recipes
+        prompt = build_prompt(
+            query, search_results, chunks_only=False, history=parent["history"]
+        )
+    else:
+        search_results = retrieve(query, limit=limit, timeout=retrieval_timeout)
+        prompt = build_prompt(query, search_results)
+
+    # "auto": the cascade picks the model, see route_model()
+    routing_decision = "manual"
+    if llm_model == routing.AUTO_MODEL:
+        if max_cost is None and routing.ROUTING_MAX_COST > 0:
+            max_cost = routing.ROUTING_MAX_COST
+        llm_model, routing_decision = route_model(
+            query, search_results, prompt, remaining(), max_cost
+        )
+
+    if routing_decision == "fallback:over_budget":
+        answer_data = _fallback_answer_data(
+            llm_model,
+            search_results,
+            start_time,
+            "Skipped: cost budget exhausted",
+            routing_decision,
+        )
+        remember(answer_data["answer"], search_results)
+        return answer_data
+
+    generation_time = remaining()
+    if generation_time is not None and generation_time < MIN_GENERATION_TIME:
+        answer_data = _fallback_answer_data(
+            llm_model,
+            search_results,
+            start_time,
+            "Skipped: latency budget exhausted",
+            routing_decision,
+        )
+        remember(answer_data["answer"], search_results)
+        return answer_data
+    try:
+        answer_text, token_stats = llm(prompt, llm_model, timeout=generation_time)
+    except llm_client.LLMDeadlineExceeded:
+        answer_data = _fallback_answer_data(
+            llm_model,
+            search_results,
+            start_time,
+            "Skipped: generation timed out",
+            routing_decision,
+        )
+        remember(answer_data["answer"], search_results)
+        return answer_data
+    openai_cost_rag = calculate_openai_cost(llm_model, token_stats)
 
-    relevance, rel_token_stats = evalualte_relevance(query, answer_text)
+    # the local score is free, the LLM judge only sees a sample and the doubtful cases
+    relevance = local_relevance.local_relevance(
+        query, answer_text, search_results, chunks_only=PROMPT_CHUNKS_ONLY
+    )
+
+    # a cheap answer that fails the local check is generated again by the strong model
+    if routing_decision.startswith("cheap") and routing.should_escalate(relevance):
+        remaining_cost = None
+        if max_cost is not None:
+            remaining_cost = max_cost - (openai_cost_rag or 0.0)
+        escalation_model = routing.ROUTING_STRONG_MODEL
+        if fits_budget(escalation_model, prompt, remaining(), remaining_cost):
+            metrics.increment("routing_escalations")
+            try:
+                escalated_text, escalated_stats = llm(
+                    prompt, escalation_model, timeout=remaining()
+                )
+                escalated_cost = calculate_openai_cost(
+                    escalation_model, escalated_stats
+                )
+                # both calls are paid for
+                token_stats = {
+                    key: token_stats[key] + escalated_stats[key] for key in token_stats
+                }
+                if openai_cost_rag is not None and escalated_cost is not None:
+                    openai_cost_rag += escalated_cost
+                else:
+                    openai_cost_rag = None
+                answer_text = escalated_text
+                llm_model = escalation_model
+                routing_decision = f"escalated:{routing_decision.split(':')[1]}"
+                relevance = local_relevance.local_relevance(
+                    query, answer_text, search_results, chunks_only=PROMPT_CHUNKS_ONLY
+                )
+            except llm_client.LLMDeadlineExceeded:
+                routing_decision = f"{routing_decision}:escalation_timed_out"
+        else:
+            routing_decision = f"{routing_decision}:escalation_over_budget"
+
+    rel_token_stats = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    evaluation_time = remaining()
+    if local_relevance.needs_llm_judge(relevance) and (
+        evaluation_time is None or evaluation_time >= MIN_EVALUATION_TIME
+    ):
+        metrics.increment("relevance_llm_judged")
+        try:
+            relevance, rel_token_stats = evalualte_relevance(
+                query, answer_text, timeout=evaluation_time
+            )
+        except llm_client.LLMDeadlineExceeded:
+            pass
+    else:
+        metrics.increment("relevance_local_only")
 
     end_time = time()
     response_time = end_time - start_time
 
-    openai_cost_rag = calculate_openai_cost(llm_model, token_stats)
-    openai_cost_eval = calculate_openai_cost(llm_model, rel_token_stats)
+    openai_cost_eval = calculate_openai_cost(EVAL_MODEL, rel_token_stats)
 
     # if cost calculation fails
     if (openai_cost_rag is not None) and (openai_cost_eval is not None):
@@ -218,6 +1002,17 @@ def rag(query: str, llm_model: str = "gpt-4o-mini", limit: int = 5) -> str:
         "eval_completion_tokens": rel_token_stats["completion_tokens"],
         "eval_total_tokens": rel_token_stats["total_tokens"],
         "openai_cost": openai_cost,
+        "routing_decision": routing_decision,
+        "cache_hit": False,
     }
+    remember(answer_text, search_results)
+    if not follow_up:
+        # the recipes come along, for the follow-ups of a cache hit
+        cache_answer(
+            query,
+            requested_model,
+            limit,
+            {**answer_data, "search_results": search_results},
+        )
 
     return answer_data
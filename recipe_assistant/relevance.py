@@ -0,0 +1,357 @@
+import argparse
+import json
+import os
+import random
+import re
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from . import embeddings
+from .ingest import project_root
+
+load_dotenv()
+
+EVAL_PATHS = [
+    project_root / "data" / "rag-eval-gpt-4o-mini.csv",
+    project_root / "data" / "rag-eval-gpt-4o.csv",
+]
+THRESHOLDS_PATH = Path(
+    os.getenv(
+        "RELEVANCE_THRESHOLDS_PATH", project_root / "data" / "relevance-thresholds.json"
+    )
+)
+
+# fraction of the answers still sent to the LLM judge, low-confidence answers always are
+JUDGE_SAMPLE_RATE = float(os.getenv("RELEVANCE_JUDGE_SAMPLE_RATE", "0.1"))
+# agreement with the LLM judge required outside the margin, the margin is calibrated for it
+TARGET_AGREEMENT = float(os.getenv("RELEVANCE_TARGET_AGREEMENT", "0.9"))
+
+LABELS = ["NON_RELEVANT", "PARTLY_RELEVANT", "RELEVANT"]
+
+# uncalibrated defaults, replaced by the file written by calibrate()
+DEFAULT_THRESHOLDS = {
+    "similarity_weight": 0.7,
+    "partly_relevant": 0.45,
+    "relevant": 0.6,
+    "margin": 0.05,
+}
+
+STOPWORDS = {
+    "the",
+    "and",
+    "for",
+    "with",
+    "you",
+    "your",
+    "are",
+    "can",
+    "this",
+    "that",
+    "from",
+    "into",
+    "then",
+    "until",
+    "about",
+    "what",
+    "which",
+    "recipe",
+    "recipes",
+    "its",
+    "has",
+    "have",
+    "was",
+    "were",
+    "will",
+    "use",
+    "used",
+    "they",
+    "them",
+}
+
+_token_pattern = re.compile(r"[a-z0-9]+")
+
+
+def load_thresholds(path: Path = THRESHOLDS_PATH) -> Dict[str, float]:
+    if path.exists():
+        with open(path) as f:
+            return {**DEFAULT_THRESHOLDS, **json.load(f)}
+    return dict(DEFAULT_THRESHOLDS)
+
+
+thresholds = load_thresholds()
+# without calibrated thresholds, the LLM judge stays the source of record
+calibrated = THRESHOLDS_PATH.exists()
+
+
+def content_tokens(text: str) -> set:
+    return {
+        token
+        for token in _token_pattern.findall(text.lower())
+        if len(token) > 2 and token not in STOPWORDS
+    }
+
+
+def context_overlap(answer: str, context: str) -> float:
+    """share of the answer's content words found in the retrieved context
+
+    Args:
+        answer (str): generated answer
+        context (str): retrieved recipe texts
+
+    Returns:
+        float: overlap between 0 and 1
+    """
+    answer_tokens = content_tokens(answer)
+    if not answer_tokens:
+        return 0.0
+    return len(answer_tokens & content_tokens(context)) / len(answer_tokens)
+
+
+def document_text(doc: Dict, chunks_only: bool = True) -> str:
+    """text of a retrieved recipe as the LLM sees it in the prompt
+
+    Args:
+        doc (Dict): retrieved recipe
+        chunks_only (bool, optional): a recipe of the chunked index is only its matching chunks. Defaults to True.
+
+    Returns:
+        str: the matching chunks, or the whole recipe text
+    """
+    if chunks_only and "chunks" in doc:
+        return "\n".join(chunk["text"] for chunk in doc["chunks"])
+    return doc["text"]  # doc['text'] should contain all the recipe information
+
+
+def relevance_features(
+    questions: List[str], answers: List[str], contexts: List[str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """question/answer cosine similarity and answer/context overlap
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: similarities and overlaps
+    """
+    question_vectors = embeddings.embed_texts(questions)
+    answer_vectors = embeddings.embed_texts(answers)
+    similarities = np.sum(question_vectors * answer_vectors, axis=1) / (
+        np.linalg.norm(question_vectors, axis=1)
+        * np.linalg.norm(answer_vectors, axis=1)
+    )
+    overlaps = np.array([context_overlap(a, c) for a, c in zip(answers, contexts)])
+    return similarities, overlaps
+
+
+def combine(similarities, overlaps, similarity_weight: float):
+    return similarity_weight * similarities + (1 - similarity_weight) * overlaps
+
+
+def classify(scores: np.ndarray, partly_relevant: float, relevant: float) -> np.ndarray:
+    """map scores to label indices of LABELS"""
+    return (scores >= partly_relevant).astype(int) + (scores >= relevant).astype(int)
+
+
+def local_relevance(
+    question: str, answer: str, search_results: List[Dict], chunks_only: bool = True
+) -> Dict:
+    """score the relevance of an answer without calling the LLM
+
+    Args:
+        question (str): user query
+        answer (str): generated answer
+        search_results (List[Dict]): retrieved recipes used to build the prompt
+        chunks_only (bool, optional): the prompt only had the matching chunks of the recipes. Defaults to True.
+
+    Returns:
+        Dict: relevance label, score, its features, and whether the score is close to a threshold
+    """
+    # the answer is checked against the context the LLM saw
+    context = " ".join(document_text(doc, chunks_only) for doc in search_results)
+    similarities, overlaps = relevance_features([question], [answer], [context])
+    score = float(combine(similarities, overlaps, thresholds["similarity_weight"])[0])
+    label = LABELS[
+        int(
+            classify(
+                np.array([score]), thresholds["partly_relevant"], thresholds["relevant"]
+            )[0]
+        )
+    ]
+    low_confidence = any(
+        abs(score - thresholds[name]) < thresholds["margin"]
+        for name in ("partly_relevant", "relevant")
+    )
+
+    return {
+        "Relevance": label,
+        "Explanation": (
+            f"Local score {score:.2f} (question similarity {similarities[0]:.2f}, "
+            f"context overlap {overlaps[0]:.2f})"
+        ),
+        "score": score,
+        "low_confidence": low_confidence,
+    }
+
+
+def needs_llm_judge(local_result: Dict) -> bool:
+    """low-confidence answers and a sampled fraction of the others go to the LLM judge
+
+    Every answer does until the thresholds are calibrated.
+    """
+    if not calibrated:
+        return True
+    return local_result["low_confidence"] or random.random() < JUDGE_SAMPLE_RATE
+
+
+def macro_f1(labels: np.ndarray, predictions: np.ndarray) -> float:
+    scores = []
+    for label in range(len(LABELS)):
+        true_positive = np.sum((predictions == label) & (labels == label))
+        predicted = np.sum(predictions == label)
+        actual = np.sum(labels == label)
+        if actual == 0:
+            continue
+        precision = true_positive / predicted if predicted else 0.0
+        recall = true_positive / actual
+        scores.append(
+            2 * precision * recall / (precision + recall) if true_positive else 0.0
+        )
+    return float(np.mean(scores))
+
+
+def retrieved_contexts(questions: List[str], limit: int = 5) -> List[str]:
+    """the context rag() gives the LLM for each question: its retrieved recipes joined
+
+    Args:
+        questions (List[str]): user queries
+        limit (int, optional): number of retrieved recipes. Defaults to 5.
+
+    Returns:
+        List[str]: context of each question
+    """
+    from . import rag
+
+    contexts = {}
+    for question in questions:
+        if question not in contexts:
+            contexts[question] = " ".join(
+                document_text(doc, rag.PROMPT_CHUNKS_ONLY)
+                for doc in rag.retrieve(question, limit=limit)
+            )
+    return [contexts[question] for question in questions]
+
+
+def calibrate_margin(
+    scores: np.ndarray,
+    labels: np.ndarray,
+    partly_relevant: float,
+    relevant: float,
+    target_agreement: float = TARGET_AGREEMENT,
+) -> Tuple[float, float]:
+    """smallest margin around the thresholds outside of which the scorer agrees enough with the judge
+
+    Args:
+        scores (np.ndarray): (answers,) local scores
+        labels (np.ndarray): (answers,) label indices of the LLM judge
+        partly_relevant (float): partly relevant threshold
+        relevant (float): relevant threshold
+        target_agreement (float, optional): agreement required outside the margin. Defaults to TARGET_AGREEMENT.
+
+    Returns:
+        Tuple[float, float]: margin, and the share of the answers within it (sent to the judge)
+    """
+    predictions = classify(scores, partly_relevant, relevant)
+    distances = np.minimum(np.abs(scores - partly_relevant), np.abs(scores - relevant))
+
+    margins = np.linspace(0, 0.2, 41)
+    for margin in margins:
+        confident = distances >= margin
+        if not confident.any() or (
+            np.mean(predictions[confident] == labels[confident]) >= target_agreement
+        ):
+            break
+    return float(margin), float(np.mean(distances < margin))
+
+
+def fit_thresholds(
+    similarities: np.ndarray, overlaps: np.ndarray, labels: np.ndarray
+) -> Dict[str, float]:
+    """weight, thresholds and margin of the local scorer that best match the judge
+
+    Args:
+        similarities (np.ndarray): (answers,) question/answer similarities
+        overlaps (np.ndarray): (answers,) answer/context overlaps
+        labels (np.ndarray): (answers,) label indices of the LLM judge
+
+    Returns:
+        Dict[str, float]: thresholds, with their macro F1, the agreement with the judge and the judged share
+    """
+    best = {"macro_f1": -1.0}
+    for weight in np.linspace(0, 1, 11):
+        scores = combine(similarities, overlaps, weight)
+        candidates = np.unique(np.quantile(scores, np.linspace(0, 1, 101)))
+        # every (partly, relevant) pair at once: shape (candidates, candidates, answers)
+        predictions = (scores[None, None, :] >= candidates[:, None, None]).astype(
+            np.int8
+        ) + (scores[None, None, :] >= candidates[None, :, None]).astype(np.int8)
+        for i, partly_relevant in enumerate(candidates):
+            for j, relevant in enumerate(candidates):
+                if relevant < partly_relevant:
+                    continue
+                f1 = macro_f1(labels, predictions[i, j])
+                if f1 > best["macro_f1"]:
+                    best = {
+                        "similarity_weight": float(weight),
+                        "partly_relevant": float(partly_relevant),
+                        "relevant": float(relevant),
+                        "macro_f1": f1,
+                        "agreement": float(np.mean(predictions[i, j] == labels)),
+                    }
+
+    scores = combine(similarities, overlaps, best["similarity_weight"])
+    best["margin"], best["judged_share"] = calibrate_margin(
+        scores, labels, best["partly_relevant"], best["relevant"]
+    )
+    return best
+
+
+def calibrate(eval_paths: List[Path] = EVAL_PATHS, limit: int = 5) -> Dict[str, float]:
+    """fit the weight and thresholds of the local scorer on the LLM-judged evaluations
+
+    The overlap is measured against the recipes retrieved for each question, as in
+    local_relevance(), so the search must be running.
+
+    Args:
+        eval_paths (List[Path], optional): evaluation csv files with answer, id, question and relevance. Defaults to EVAL_PATHS.
+        limit (int, optional): number of retrieved recipes, as in rag(). Defaults to 5.
+
+    Returns:
+        Dict[str, float]: calibrated thresholds, with their macro F1 and the agreement with the LLM judge
+    """
+    df_eval = pd.concat([pd.read_csv(path) for path in eval_paths], ignore_index=True)
+    df_eval = df_eval[df_eval.relevance.isin(LABELS)]
+
+    labels = df_eval.relevance.map(LABELS.index).to_numpy()
+    similarities, overlaps = relevance_features(
+        df_eval.question.tolist(),
+        df_eval.answer.astype(str).tolist(),
+        retrieved_contexts(df_eval.question.tolist(), limit),
+    )
+
+    return fit_thresholds(similarities, overlaps, labels)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Calibrate the local relevance scorer against the LLM judge"
+    )
+    parser.add_argument("--output", default=str(THRESHOLDS_PATH))
+    parser.add_argument("--limit", type=int, default=5, help="retrieved recipes")
+    args = parser.parse_args()
+
+    calibrated = calibrate(limit=args.limit)
+    print(json.dumps(calibrated, indent=2))
+    with open(args.output, "w") as f:
+        json.dump(calibrated, f, indent=2)
+    print(f"Thresholds saved to {args.output}")
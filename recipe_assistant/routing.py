@@ -0,0 +1,78 @@
+from . import relevance
+
+from dotenv import load_dotenv
+from typing import Dict, List
+import os
+
+load_dotenv()
+
+# llm_model of the requests that let the cascade pick the model
+AUTO_MODEL = "auto"
+
+ROUTING_CHEAP_MODEL = os.getenv("ROUTING_CHEAP_MODEL", "gpt-4o-mini")
+ROUTING_STRONG_MODEL = os.getenv("ROUTING_STRONG_MODEL", "gpt-4o")
+# dollars of generation per request, 0 disables the limit
+ROUTING_MAX_COST = float(os.getenv("ROUTING_MAX_COST", "0"))
+# tokens expected in an answer, to estimate the cost of a call before making it
+ROUTING_EXPECTED_COMPLETION_TOKENS = int(
+    os.getenv("ROUTING_EXPECTED_COMPLETION_TOKENS", "300")
+)
+# latency of a call to a model with no recent calls, in seconds
+ROUTING_DEFAULT_LATENCY = float(os.getenv("ROUTING_DEFAULT_LATENCY", "5"))
+
+# a simple question is short and names the recipe found at the top of the search
+SIMPLE_MAX_WORDS = int(os.getenv("ROUTING_SIMPLE_MAX_WORDS", "20"))
+SIMPLE_MIN_NAME_OVERLAP = float(os.getenv("ROUTING_SIMPLE_MIN_NAME_OVERLAP", "0.5"))
+# words asking for more than looking up a fact of one recipe
+COMPLEX_MARKERS = {
+    "compare",
+    "difference",
+    "different",
+    "plan",
+    "menu",
+    "week",
+    "substitute",
+    "replace",
+    "instead",
+    "healthier",
+    "why",
+    "explain",
+    "recommend",
+    "suggest",
+    "options",
+    "which",
+}
+
+
+def retrieval_confidence(question: str, search_results: List[Dict]) -> float:
+    """share of the top recipe's name words found in the question
+
+    Args:
+        question (str): user query
+        search_results (List[Dict]): retrieved recipes
+
+    Returns:
+        float: between 0 (no result or no shared word) and 1
+    """
+    if not search_results:
+        return 0.0
+
+    name_tokens = relevance.content_tokens(search_results[0]["recipe_name"])
+    if not name_tokens:
+        return 0.0
+    return len(name_tokens & relevance.content_tokens(question)) / len(name_tokens)
+
+
+def is_simple_question(question: str, search_results: List[Dict]) -> bool:
+    """a short factual question about a recipe the search found with confidence"""
+    words = question.lower().split()
+    if len(words) > SIMPLE_MAX_WORDS:
+        return False
+    if COMPLEX_MARKERS & {word.strip("?,.!") for word in words}:
+        return False
+    return retrieval_confidence(question, search_results) >= SIMPLE_MIN_NAME_OVERLAP
+
+
+def should_escalate(local_result: Dict) -> bool:
+    """the answer of the cheap model failed the local relevance check"""
+    return local_result["Relevance"] != "RELEVANT" or local_result["low_confidence"]
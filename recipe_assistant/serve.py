@@ -0,0 +1,229 @@
+"""Pre-fork multi-worker server
+
+The parent process initializes the database and the Qdrant collection, loads
+the embedding models once and then forks the workers, which share the model
+weights copy-on-write. Qdrant and OpenAI clients are created in each worker
+after the fork, and a worker that dies is forked again.
+
+With WARMUP_ON_STARTUP, the parent also answers the warm-up questions once
+before forking, so every worker starts with the same answer cache; the workers
+only warm their models.
+
+Everything else held in memory is per worker: the admission limits and client
+rate limits, the answer and embedding caches filled after the fork, the
+conversation sessions, /metrics and the profiler.
+
+    uv run python -m recipe_assistant.serve --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import traceback
+from time import sleep, time
+from typing import Dict, Optional, Tuple
+
+# must be set before the app is imported: the parent runs the init once, and
+# single-threaded onnxruntime sessions have no thread pool to lose in the fork
+os.environ["INIT_ON_STARTUP"] = "false"
+os.environ.setdefault("EMBEDDING_THREADS", "1")
+
+import uvicorn  # noqa: E402
+
+from . import clients, embeddings  # noqa: E402
+from .app.core.config import settings  # noqa: E402
+from .app.main import app  # noqa: E402
+from .db import init_db  # noqa: E402
+from .rag import init_qdrant  # noqa: E402
+from .warmup import load_questions, warm_up  # noqa: E402
+
+# seconds before forking a replacement of a dead worker, to not spin on a crash loop
+RESPAWN_DELAY = float(os.getenv("WORKER_RESPAWN_DELAY", "1"))
+
+
+def memory_usage() -> Dict[str, int]:
+    """resident and proportional set size of the current process in kB (Linux only)
+
+    The proportional set size splits the pages shared copy-on-write between the
+    processes sharing them.
+    """
+    usage = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                usage["rss_kb"] = int(line.split()[1])
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    usage["pss_kb"] = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return usage
+
+
+async def _serve_and_report(
+    server: uvicorn.Server, sock, report_fd: Optional[int], fork_time: float
+):
+    task = asyncio.create_task(server.serve(sockets=[sock]))
+    # ready as /ready reports it: serving, with the warm-up finished
+    while not (server.started and app.state.ready) and not task.done():
+        await asyncio.sleep(0.05)
+
+    if report_fd is not None:
+        report = {
+            "pid": os.getpid(),
+            "time_to_ready": time() - fork_time,
+            **memory_usage(),
+        }
+        os.write(report_fd, (json.dumps(report) + "\n").encode())
+        os.close(report_fd)
+
+    await task
+
+
+def run_worker(
+    config: uvicorn.Config, sock, report_fd: Optional[int], fork_time: float
+) -> None:
+    server = uvicorn.Server(config)
+    asyncio.run(_serve_and_report(server, sock, report_fd, fork_time))
+
+
+def fork_worker(
+    config: uvicorn.Config, sock, report: bool = True
+) -> Tuple[int, Optional[int]]:
+    """fork a worker serving on the shared socket
+
+    Args:
+        config (uvicorn.Config): server config
+        sock: bound socket shared by the workers
+        report (bool, optional): the worker writes its report once ready. Defaults to True.
+
+    Returns:
+        Tuple[int, Optional[int]]: worker pid and the read end of its report pipe
+    """
+    read_fd, write_fd = os.pipe() if report else (None, None)
+    fork_time = time()
+    pid = os.fork()
+    if pid == 0:
+        # the parent's handlers stop the workers, not the worker itself
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if read_fd is not None:
+            os.close(read_fd)
+        try:
+            run_worker(config, sock, write_fd, fork_time)
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+
+    if write_fd is not None:
+        os.close(write_fd)
+    return pid, read_fd
+
+
+def read_report(read_fd: int) -> Optional[Dict]:
+    """report of a worker, None if it died before being ready"""
+    with os.fdopen(read_fd) as f:
+        line = f.readline()
+    return json.loads(line) if line else None
+
+
+def serve(host: str = "0.0.0.0", port: int = 8000, workers: int = 2) -> None:
+    """initialize once, preload the models and fork the workers
+
+    Args:
+        host (str, optional): bind address. Defaults to "0.0.0.0".
+        port (int, optional): bind port. Defaults to 8000.
+        workers (int, optional): number of worker processes. Defaults to 2.
+    """
+    start_time = time()
+    # read the warm-up questions first: init_db() recreates the conversations table
+    questions = []
+    if settings.WARMUP_ON_STARTUP:
+        questions = load_questions(settings.WARMUP_SOURCE, settings.WARMUP_TOP_N)
+    # the workers inherit the answer cache, they only warm their models
+    settings.WARMUP_ON_STARTUP = False
+
+    # a gRPC channel open in the parent breaks in the forked workers, the parent
+    # initializes over REST whatever the workers use
+    prefer_grpc = clients.QDRANT_PREFER_GRPC
+    clients.QDRANT_PREFER_GRPC = False
+    try:
+        init_db()
+        init_qdrant()
+        embeddings.preload()
+        if questions:
+            warm_up(
+                questions,
+                llm_model=settings.WARMUP_LLM_MODEL,
+                concurrency=settings.WARMUP_CONCURRENCY,
+            )
+    finally:
+        # no connection may be inherited by the workers
+        clients.close_clients()
+        clients.QDRANT_PREFER_GRPC = prefer_grpc
+    print(f"Parent {os.getpid()} ready in {time() - start_time:.1f}s: {memory_usage()}")
+
+    config = uvicorn.Config(app, host=host, port=port)
+    sock = config.bind_socket()
+
+    forked = [fork_worker(config, sock) for _ in range(workers)]
+    pids = {pid for pid, _ in forked}
+    stopping = False
+
+    def stop_workers(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop_workers)
+    signal.signal(signal.SIGTERM, stop_workers)
+
+    for pid, read_fd in forked:
+        report = read_report(read_fd)
+        if report is None:
+            print(f"Worker {pid} exited before being ready")
+            continue
+        print(
+            f"Worker {report['pid']} ready in {report['time_to_ready']:.2f}s, "
+            f"RSS {report.get('rss_kb', 0) / 1024:.0f} MB, "
+            f"PSS {report.get('pss_kb', 0) / 1024:.0f} MB"
+        )
+
+    exit_code = 0
+    while pids:
+        pid, status = os.wait()
+        pids.discard(pid)
+        code = os.waitstatus_to_exitcode(status)
+        if stopping:
+            if code not in (0, -signal.SIGTERM):
+                exit_code = 1
+            continue
+
+        # a worker died on its own: replace it, without blocking on its report
+        print(f"Worker {pid} exited with {code}, forking a new one")
+        sleep(RESPAWN_DELAY)
+        if stopping:
+            continue
+        new_pid, _ = fork_worker(config, sock, report=False)
+        pids.add(new_pid)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-fork multi-worker server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers)
@@ -0,0 +1,162 @@
+from . import embeddings
+from . import relevance
+
+from dotenv import load_dotenv
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, List, Optional
+import numpy as np
+import os
+import threading
+
+load_dotenv()
+
+# conversations a follow-up can refer to, kept in memory by each worker
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))  # seconds since the last turn
+SESSION_MAX_SIZE = int(os.getenv("SESSION_MAX_SIZE", "10000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "3"))  # turns put in the prompt
+# below this similarity to the conversation, a follow-up starts a new search
+SESSION_TOPIC_SIMILARITY = float(os.getenv("SESSION_TOPIC_SIMILARITY", "0.5"))
+
+# words that refer back to the previous answer
+FOLLOW_UP_MARKERS = {
+    "it",
+    "its",
+    "that",
+    "this",
+    "these",
+    "those",
+    "them",
+    "they",
+    "one",
+    "instead",
+    "also",
+    "same",
+    "more",
+    "less",
+    "else",
+}
+
+
+class SessionStore:
+    """bounded store of the retrieved recipe ids and turns of recent conversations
+
+    Entries expire SESSION_TTL seconds after their last turn, and the oldest ones
+    are evicted beyond max_size.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_size: int = SESSION_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is None:
+                return None
+            if monotonic() - session["updated"] > self.ttl:
+                del self._sessions[conversation_id]
+                return None
+            return session
+
+    def put(self, conversation_id: str, session: Dict) -> None:
+        with self._lock:
+            session["updated"] = monotonic()
+            self._sessions[conversation_id] = session
+            self._sessions.move_to_end(conversation_id)
+
+            # oldest first: stop at the first entry still alive
+            now = monotonic()
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if (
+                    len(self._sessions) <= self.max_size
+                    and now - oldest["updated"] <= self.ttl
+                ):
+                    break
+                del self._sessions[oldest_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+store = SessionStore()
+
+
+def new_session(
+    question: str,
+    answer: str,
+    search_results: List[Dict],
+    parent: Optional[Dict] = None,
+) -> Dict:
+    """session of a conversation, continuing the parent's turns and topic
+
+    Args:
+        question (str): user query
+        answer (str): generated answer
+        search_results (List[Dict]): recipes retrieved for the conversation
+        parent (Optional[Dict], optional): session of the parent conversation. Defaults to None.
+
+    Returns:
+        Dict: session to store. Only the recipe ids and names are kept, a follow-up
+        fetches the recipes again by id.
+    """
+    history = list(parent["history"]) if parent else []
+    history.append({"question": question, "answer": answer})
+
+    if parent:
+        topic = parent["topic"]
+        topic_vector = parent.get("topic_vector")
+    else:
+        # what the conversation is about: the question and the recipes it found
+        topic = " ".join([question] + [doc["recipe_name"] for doc in search_results])
+        topic_vector = None
+
+    return {
+        "recipe_ids": [doc["recipe_id"] for doc in search_results],
+        # for the topic check
+        "recipe_names": [doc["recipe_name"] for doc in search_results],
+        "history": history[-SESSION_MAX_TURNS:],
+        "topic": topic,
+        "topic_vector": topic_vector,
+    }
+
+
+def topic_changed(question: str, session: Dict) -> bool:
+    """cheap local check of whether a follow-up leaves the conversation's recipes
+
+    A question referring back to the conversation ("that", "instead", ...) or
+    naming one of its recipes stays on topic. Otherwise the question is compared
+    to the conversation topic with the dense embedding model.
+
+    Args:
+        question (str): follow-up question
+        session (Dict): session of the parent conversation
+
+    Returns:
+        bool: True when a new search should run
+    """
+    words = {word.strip("?,.!'\"") for word in question.lower().split()}
+    if words & FOLLOW_UP_MARKERS:
+        return False
+
+    question_tokens = relevance.content_tokens(question)
+    for recipe_name in session["recipe_names"]:
+        if question_tokens & relevance.content_tokens(recipe_name):
+            return False
+
+    if session.get("topic_vector") is None:
+        session["topic_vector"] = np.asarray(
+            embeddings.embed_texts([session["topic"]])[0], dtype=np.float32
+        )
+    question_vector = np.array(embeddings.dense_query_vector(question))
+    topic_vector = session["topic_vector"]
+    similarity = float(
+        question_vector
+        @ topic_vector
+        / (np.linalg.norm(question_vector) * np.linalg.norm(topic_vector))
+    )
+    return similarity < SESSION_TOPIC_SIMILARITY
@@ -0,0 +1,99 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import time
+from typing import Dict, List, Optional
+
+from . import rag
+from . import embeddings
+from .db import get_top_questions
+from .ingest import QUESTIONS_PATH
+
+
+def load_questions(
+    source: str = "csv", top_n: Optional[int] = None, path: str = QUESTIONS_PATH
+) -> List[str]:
+    """load the questions used to warm up the caches
+
+    Args:
+        source (str, optional): "csv" for the ground truth question set, "conversations" for the most asked questions. Defaults to "csv".
+        top_n (Optional[int], optional): maximum number of questions. Defaults to None (all of the csv, 100 from the conversations).
+        path (str, optional): path to the question csv. Defaults to QUESTIONS_PATH.
+
+    Raises:
+        ValueError: unknown source, or no question found
+
+    Returns:
+        List[str]: unique questions
+    """
+    if source == "csv":
+        questions = pd.read_csv(path)["question"].dropna().tolist()
+    elif source == "conversations":
+        questions = get_top_questions(limit=top_n or 100)
+    else:
+        raise ValueError(f"Unknown warm-up source: {source}")
+
+    questions = list(dict.fromkeys(q.strip() for q in questions if q.strip()))
+    if top_n is not None:
+        questions = questions[:top_n]
+    if not questions:
+        raise ValueError(f"No warm-up questions found in the {source} source")
+    return questions
+
+
+def warm_models() -> None:
+    """run a dummy query through both embedding models and Qdrant"""
+    start_time = time()
+    embeddings.preload()
+    rag.retrieve("quick chicken dinner", limit=1)
+    print(f"Models warmed up in {time() - start_time:.1f}s")
+
+
+def warm_up(
+    questions: List[str],
+    llm_model: str = "gpt-4o-mini",
+    limit: int = 5,
+    concurrency: int = 4,
+) -> Dict[str, float]:
+    """run the questions through the rag pipeline to fill the answer and embedding caches
+
+    Args:
+        questions (List[str]): questions to pre-answer
+        llm_model (str, optional): llm model used. Defaults to "gpt-4o-mini".
+        limit (int, optional): number of retrieved recipes. Defaults to 5.
+        concurrency (int, optional): maximum number of questions in flight. Defaults to 4.
+
+    Returns:
+        Dict[str, float]: warm-up statistics
+    """
+    start_time = time()
+
+    # load the models once before the workers race for them
+    embeddings.get_dense_model()
+    embeddings.get_sparse_model()
+
+    answered = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(rag.rag, question, llm_model, limit): question
+            for question in questions
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+                answered += 1
+            except Exception as e:
+                failed += 1
+                print(f"Warm-up failed for '{futures[future]}': {e}")
+
+    stats = {
+        "questions": len(questions),
+        "answered": answered,
+        "failed": failed,
+        "elapsed": time() - start_time,
+    }
+    print(
+        f"Warm-up finished: {answered}/{len(questions)} answered, "
+        f"{failed} failed in {stats['elapsed']:.1f}s"
+    )
+    return stats
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+# required by the app settings, no request leaves the tests
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("QDRANT_URL", "http://localhost:6333")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """fake monotonic clock of the session store and the admission control"""
+    from recipe_assistant import sessions
+    from recipe_assistant.app.core import admission
+
+    now = [100.0]
+    for module in (sessions, admission):
+        monkeypatch.setattr(module, "monotonic", lambda: now[0])
+    return now
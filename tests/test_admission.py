@@ -0,0 +1,23 @@
+import pytest
+
+from recipe_assistant.app.core import admission
+
+
+def test_token_bucket_allows_the_burst_then_waits(clock):
+    bucket = admission.TokenBucket(rate=2, burst=3)
+
+    assert [bucket.take() for _ in range(3)] == [None, None, None]
+    assert bucket.take() == pytest.approx(0.5)
+
+
+def test_token_bucket_refills_up_to_the_burst(clock):
+    bucket = admission.TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        bucket.take()
+
+    clock[0] += 0.5
+    assert bucket.take() is None
+    assert bucket.take() == pytest.approx(0.5)
+
+    clock[0] += 60
+    assert [bucket.take() for _ in range(4)][-1] is not None
@@ -0,0 +1,73 @@
+import numpy as np
+from qdrant_client import models
+
+from recipe_assistant.benchmarks.retrieval import (
+    DENSE_DIM,
+    hit_rate_mrr,
+    metric_value,
+    synthetic_batches,
+)
+from recipe_assistant.benchmarks.sweep import pareto_frontier
+
+
+def test_hit_rate_mrr():
+    result_ids = np.array([[3, 1, 2], [4, 5, 6], [7, -1, -1], [9, 8, -1]])
+    expected_ids = np.array([1, 4, 2, 8])
+
+    hit_rate, mrr = hit_rate_mrr(result_ids, expected_ids)
+
+    assert hit_rate == 0.75
+    assert mrr == (1 / 2 + 1 + 0 + 1 / 2) / 4
+
+
+def test_pareto_frontier_drops_dominated_settings():
+    latencies = np.array([10.0, 20.0, 15.0, 20.0, 30.0])
+    quality = np.array([0.5, 0.7, 0.4, 0.7, 0.6])
+
+    # 2 is slower and worse than 0, 4 slower and worse than 1, ties stay
+    assert pareto_frontier(latencies, quality).tolist() == [
+        True,
+        True,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_synthetic_batches():
+    rng = np.random.default_rng(0)
+    points = [
+        models.PointStruct(
+            id=i,
+            vector={
+                "jina-small": rng.random(DENSE_DIM).tolist(),
+                "bm25": models.SparseVector(indices=[1, 2, 3, 4], values=[0.1] * 4),
+            },
+            payload={"recipe_id": i, "text": f"recipe {i}"},
+        )
+        for i in range(3)
+    ]
+
+    batches = list(synthetic_batches(points, scale=10, batch_size=4))
+
+    assert [len(batch) for batch in batches] == [4, 3]
+    synthetic = [point for batch in batches for point in batch]
+    assert [point.id for point in synthetic] == list(range(3, 10))
+    for point in synthetic:
+        assert point.payload["recipe_id"] == -1
+        assert np.isclose(np.linalg.norm(point.vector["jina-small"]), 1, atol=1e-5)
+        assert set(point.vector["bm25"].indices) <= {1, 2, 3, 4}
+    # the same seed gives the same corpus for every profile
+    again = [point for batch in synthetic_batches(points, 10, 4) for point in batch]
+    assert again == synthetic
+
+
+def test_metric_value():
+    metrics_text = (
+        "# TYPE memory_resident_bytes gauge\n"
+        "memory_resident_bytes 104857600\n"
+        'rest_responses_total{method="GET"} 3\n'
+    )
+
+    assert metric_value(metrics_text, "memory_resident_bytes") == 104857600
+    assert metric_value(metrics_text, "memory_allocated_bytes") is None
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from recipe_assistant import ingest, rag, relevance
+
+RECIPE = {
+    "recipe_id": 7,
+    "recipe_name": " Ground Beef Gyros ",
+    "recipe_description": " Greek-style pitas. ",
+    "ratings": "4.5",
+    "ready-in": "22 mins",
+    "directions": "['Mix the beef.', 'Grill it. ']",
+    "ingredients": "['1 pound ground beef', 'pita breads']",
+}
+
+
+def test_prepare_recipe_chunks():
+    chunks = ingest.prepare_recipe_chunks([RECIPE])
+
+    assert [chunk["field"] for chunk in chunks] == ingest.CHUNK_FIELDS
+    assert [chunk["point_id"] for chunk in chunks] == [21, 22, 23]
+    assert [chunk["chunk_text"] for chunk in chunks] == [
+        "Recipe: Ground Beef Gyros | Description: Greek-style pitas. | Ratings: 4.5 | Ready in: 22 mins",
+        "Recipe: Ground Beef Gyros | Ingredients: 1 pound ground beef; pita breads",
+        "Recipe: Ground Beef Gyros | Directions: Mix the beef. Grill it.",
+    ]
+    assert all(chunk["recipe_id"] == 7 for chunk in chunks)
+
+
+def chunk_hit(field, text):
+    payload = {"recipe_id": 7, "recipe_name": "Ground Beef Gyros", "text": "whole"}
+    return SimpleNamespace(payload={**payload, "field": field, "chunk_text": text})
+
+
+def test_merge_chunk_hits_keeps_the_best_chunk_first():
+    result = rag.merge_chunk_hits(
+        [chunk_hit("ingredients", "beef; pita"), chunk_hit("directions", "grill")]
+    )
+
+    assert result == {
+        "recipe_id": 7,
+        "recipe_name": "Ground Beef Gyros",
+        "text": "whole",
+        "chunks": [
+            {"field": "ingredients", "text": "beef; pita"},
+            {"field": "directions", "text": "grill"},
+        ],
+    }
+
+
+def test_build_prompt_with_chunks_only():
+    result = rag.merge_chunk_hits(
+        [chunk_hit("ingredients", "beef; pita"), chunk_hit("directions", "grill")]
+    )
+
+    prompt = rag.build_prompt("What is in it?", [result], chunks_only=True)
+    assert "beef; pita\ngrill" in prompt
+    assert "whole" not in prompt
+
+    prompt = rag.build_prompt("What is in it?", [result], chunks_only=False)
+    assert "whole" in prompt
+    assert "beef; pita" not in prompt
+
+
+def test_local_relevance_scores_against_the_chunks(monkeypatch):
+    contexts = []
+
+    def fake_features(questions, answers, doc_contexts):
+        contexts.extend(doc_contexts)
+        return np.array([0.9]), np.array([0.9])
+
+    monkeypatch.setattr(relevance, "relevance_features", fake_features)
+    monkeypatch.setattr(
+        relevance,
+        "thresholds",
+        {
+            "similarity_weight": 0.5,
+            "partly_relevant": 0.4,
+            "relevant": 0.7,
+            "margin": 0.05,
+        },
+    )
+    result = rag.merge_chunk_hits([chunk_hit("ingredients", "beef; pita")])
+
+    relevance.local_relevance("What is in it?", "Beef.", [result])
+    relevance.local_relevance("What is in it?", "Beef.", [result], chunks_only=False)
+
+    assert contexts == ["beef; pita", "whole"]
@@ -0,0 +1,22 @@
+from recipe_assistant.db import bulk_feedback_statuses
+
+
+def test_bulk_feedback_statuses():
+    items = [
+        ("conv-1", 1, "key-1"),
+        ("conv-1", 1, "key-1"),  # repeated within the batch
+        ("conv-2", -1, "key-1"),  # same key, other conversation
+        ("conv-1", -1, "key-2"),  # already stored by an earlier request
+        ("conv-1", 1, None),
+        ("conv-3", 1, "key-3"),
+    ]
+    inserted_keys = {("conv-1", "key-1"), ("conv-2", "key-1")}
+
+    assert bulk_feedback_statuses(items, {"conv-1", "conv-2"}, inserted_keys) == [
+        "created",
+        "duplicate",
+        "created",
+        "duplicate",
+        "created",
+        "unknown_conversation",
+    ]
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from recipe_assistant.app.api.endpoints import decode_cursor, encode_cursor
+from recipe_assistant.app.models.schemas import QuestionRequest
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+
+    cursor = encode_cursor(timestamp, "conv-1")
+
+    assert decode_cursor(cursor) == (timestamp, "conv-1")
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "bm90IGpzb24=", "e30="])
+def test_invalid_cursor_is_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("deadline_ms", [0, -5, 120001])
+def test_invalid_deadline_is_rejected(deadline_ms):
+    with pytest.raises(ValidationError):
+        QuestionRequest(question="How long?", deadline_ms=deadline_ms)
+
+
+def test_deadline_is_optional():
+    assert QuestionRequest(question="How long?").deadline_ms is None
+    assert QuestionRequest(question="How long?", deadline_ms=500).deadline_ms == 500
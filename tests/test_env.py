@@ -0,0 +1,29 @@
+import pytest
+
+from recipe_assistant.env import env_flag, parse_flag
+
+
+@pytest.mark.parametrize(
+    "value, flag",
+    [
+        ("1", True),
+        ("true", True),
+        ("True", True),
+        (" TRUE ", True),
+        ("0", False),
+        ("false", False),
+        ("yes", False),
+        ("", False),
+    ],
+)
+def test_parse_flag(value, flag):
+    assert parse_flag(value) is flag
+
+
+def test_env_flag_default(monkeypatch):
+    monkeypatch.delenv("RECIPE_TEST_FLAG", raising=False)
+    assert env_flag("RECIPE_TEST_FLAG") is False
+    assert env_flag("RECIPE_TEST_FLAG", default=True) is True
+
+    monkeypatch.setenv("RECIPE_TEST_FLAG", "false")
+    assert env_flag("RECIPE_TEST_FLAG", default=True) is False
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from recipe_assistant import evaluate
+
+
+def fake_evaluate_question(calls):
+    lock = threading.Lock()
+
+    def evaluate_question(record, llm_model, limit=5):
+        with lock:
+            calls.append(record["id"])
+        time.sleep(0.05)
+        return {
+            "id": record["id"],
+            "question": record["question"],
+            "relevance": "RELEVANT",
+        }
+
+    return evaluate_question
+
+
+def records(n):
+    return [{"id": i, "question": f"question {i}"} for i in range(n)]
+
+
+def test_run_evaluation_resumes_from_checkpoint(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(evaluate, "evaluate_question", fake_evaluate_question(calls))
+    checkpoint = tmp_path / "checkpoint.jsonl"
+
+    evaluate.run_evaluation(records(5), checkpoint_path=checkpoint, concurrency=2)
+    results = evaluate.run_evaluation(
+        records(8), checkpoint_path=checkpoint, concurrency=2
+    )
+
+    assert sorted(calls) == list(range(5)) + [5, 6, 7]
+    assert len(results) == 8
+    assert len(evaluate.load_checkpoint(checkpoint)) == 8
+
+
+def test_interrupt_stops_submitting_and_checkpoints_in_flight(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(evaluate, "evaluate_question", fake_evaluate_question(calls))
+
+    real_wait = evaluate.wait
+    waits = []
+
+    def interrupted_wait(*args, **kwargs):
+        waits.append(1)
+        if len(waits) == 2:
+            raise KeyboardInterrupt
+        return real_wait(*args, **kwargs)
+
+    monkeypatch.setattr(evaluate, "wait", interrupted_wait)
+    checkpoint = tmp_path / "checkpoint.jsonl"
+
+    evaluate.run_evaluation(records(40), checkpoint_path=checkpoint, concurrency=4)
+
+    # the first batch, and the questions submitted after the first completions
+    assert len(calls) < 10
+    assert len(evaluate.load_checkpoint(checkpoint)) == len(calls)
+
+
+def test_checkpoint_name_depends_on_the_run():
+    name = evaluate.checkpoint_name("gpt-4o-mini", "data/questions.csv", None, 5)
+
+    assert name.startswith("eval-checkpoint-gpt-4o-mini-")
+    assert name == evaluate.checkpoint_name(
+        "gpt-4o-mini", "data/questions.csv", None, 5
+    )
+    for other in [
+        ("gpt-4o-mini", "data/other.csv", None, 5),
+        ("gpt-4o-mini", "data/questions.csv", 50, 5),
+        ("gpt-4o-mini", "data/questions.csv", None, 10),
+    ]:
+        assert evaluate.checkpoint_name(*other) != name
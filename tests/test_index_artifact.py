@@ -0,0 +1,26 @@
+from qdrant_client import models
+
+from recipe_assistant import embeddings, index_artifact, ingest
+
+
+def fake_embed_documents(texts):
+    dense = [[float(i), 0.5] for i in range(len(texts))]
+    # sparse vectors of different lengths, to check the offsets
+    sparse = [
+        models.SparseVector(indices=list(range(i % 3 + 1)), values=[0.25] * (i % 3 + 1))
+        for i in range(len(texts))
+    ]
+    return dense, sparse
+
+
+def test_artifact_round_trip(monkeypatch, tmp_path):
+    monkeypatch.setattr(embeddings, "embed_documents", fake_embed_documents)
+    version = ingest.index_version(ingest.DATA_PATH, "recipe")
+    expected = ingest.build_points(
+        ingest.prepare_index_documents("recipe", ingest.DATA_PATH), version
+    )
+
+    path = index_artifact.build_artifact(artifact_dir=tmp_path, mode="recipe")
+
+    assert index_artifact.find_artifact(version, tmp_path) == path
+    assert index_artifact.load_points(path) == expected
@@ -0,0 +1,13 @@
+from qdrant_client import QdrantClient
+
+from recipe_assistant import ingest
+
+
+def test_create_collection_with_the_given_client(monkeypatch):
+    qdrant_client = QdrantClient(":memory:")
+    # the shared client is not used
+    monkeypatch.setattr(ingest.clients, "get_qdrant_client", lambda: None)
+
+    ingest.create_qdrant_collection("recipes", qdrant_client=qdrant_client)
+
+    assert qdrant_client.collection_exists("recipes")
@@ -0,0 +1,120 @@
+import threading
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from recipe_assistant import llm_client
+
+
+def completion(prompt_tokens: int, completion_tokens: int) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "answer"},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+    )
+
+
+@pytest.fixture
+def hedged(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(llm_client, "hedge_delay", lambda llm_model: 0.05)
+
+
+def test_hedged_call_counts_the_running_loser(monkeypatch, hedged):
+    release = threading.Event()
+    calls = []
+
+    def fake_timed_call(llm_model, messages, timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            # the first request is slow and loses
+            release.wait(5)
+        return completion(10, 5)
+
+    monkeypatch.setattr(llm_client, "_timed_call", fake_timed_call)
+    response = llm_client._hedged_call("gpt-4o-mini", [], timeout=10)
+    release.set()
+
+    assert len(calls) == 2
+    assert response.usage.prompt_tokens == 20
+    assert response.usage.completion_tokens == 10
+    assert response.usage.total_tokens == 30
+
+
+def test_failed_loser_adds_no_usage():
+    failed = llm_client._executor.submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        failed.result()
+
+    response = llm_client._with_loser_usage(completion(10, 5), failed)
+    assert response.usage.total_tokens == 15
+
+
+class FakeCompletions:
+    def __init__(self, clock, elapsed, error=None):
+        self.clock = clock
+        self.elapsed = elapsed
+        self.error = error
+
+    def create(self, model, messages, timeout):
+        self.clock[0] += self.elapsed
+        if self.error is not None:
+            raise self.error
+        return completion(10, 5)
+
+
+@pytest.fixture
+def latencies(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(llm_client, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(llm_client, "_latencies", defaultdict(list))
+    return clock
+
+
+def fake_client(monkeypatch, completions):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(llm_client, "get_openai_client", lambda: client)
+
+
+def test_timed_call_records_successful_attempts(monkeypatch, latencies):
+    fake_client(monkeypatch, FakeCompletions(latencies, elapsed=1.5))
+
+    llm_client._timed_call("gpt-4o-mini", [], timeout=10)
+
+    assert llm_client._latencies["gpt-4o-mini"] == [1.5]
+
+
+def test_timed_call_records_failed_attempts_capped_at_the_deadline(
+    monkeypatch, latencies
+):
+    fake_client(
+        monkeypatch, FakeCompletions(latencies, elapsed=2.0, error=ValueError())
+    )
+    with pytest.raises(ValueError):
+        llm_client._timed_call("gpt-4o-mini", [], timeout=10)
+
+    # a timed-out attempt counts as the whole deadline, not more
+    fake_client(
+        monkeypatch, FakeCompletions(latencies, elapsed=12.0, error=TimeoutError())
+    )
+    with pytest.raises(TimeoutError):
+        llm_client._timed_call("gpt-4o-mini", [], timeout=10)
+
+    assert llm_client._latencies["gpt-4o-mini"] == [2.0, 10]
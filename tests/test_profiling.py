@@ -0,0 +1,95 @@
+from collections import Counter
+from types import SimpleNamespace
+
+from recipe_assistant.app.core import profiling
+from recipe_assistant.app.core.profiling import RequestProfiler, StackSampler
+
+
+def fake_frame(*calls):
+    """innermost call last, e.g. fake_frame(("rag.py", "rag"), ("thread.py", "_worker"))"""
+    frame = None
+    for line, (filename, name) in enumerate(calls, start=1):
+        code = SimpleNamespace(
+            co_filename=f"/usr/lib/python3/{filename}",
+            co_name=name,
+            co_firstlineno=line,
+        )
+        frame = SimpleNamespace(f_code=code, f_back=frame)
+    return frame
+
+
+class FakeStopEvent:
+    """lets the sampler take a fixed number of samples without waiting"""
+
+    def __init__(self, samples: int):
+        self.samples = samples
+
+    def wait(self, interval):
+        self.samples -= 1
+        return self.samples < 0
+
+
+def test_should_profile_counts_armed_requests():
+    profiler = RequestProfiler("unused", 0.01)
+
+    assert not profiler.should_profile()
+    assert profiler.arm(2) == 2
+    # requested profiles do not use up the armed ones
+    assert profiler.should_profile(requested=True)
+    assert profiler.should_profile()
+    assert profiler.should_profile()
+    assert not profiler.should_profile()
+    assert profiler.pending == 0
+
+
+def test_is_idle():
+    sampler = StackSampler(0.01)
+
+    assert sampler._is_idle(
+        fake_frame(("threading.py", "run"), ("thread.py", "_worker"))
+    )
+    assert sampler._is_idle(fake_frame(("queue.py", "get"), ("threading.py", "wait")))
+    assert sampler._is_idle(
+        fake_frame(("base_events.py", "run"), ("selectors.py", "select"))
+    )
+    # waiting on anything but a work queue is time spent by a request
+    assert not sampler._is_idle(fake_frame(("rag.py", "rag"), ("threading.py", "wait")))
+    assert not sampler._is_idle(
+        fake_frame(("thread.py", "_worker"), ("rag.py", "search"))
+    )
+    assert not sampler._is_idle(fake_frame(("threading.py", "wait")))
+
+
+def test_sampler_folds_busy_stacks(monkeypatch):
+    frames = {
+        1: fake_frame(("thread.py", "_worker"), ("rag.py", "search")),
+        2: fake_frame(("thread.py", "_worker")),
+    }
+    threads = [
+        SimpleNamespace(ident=1, name="ThreadPoolExecutor-0_3"),
+        SimpleNamespace(ident=2, name="ThreadPoolExecutor-0_4"),
+    ]
+    monkeypatch.setattr(profiling.sys, "_current_frames", lambda: frames)
+    monkeypatch.setattr(profiling.threading, "enumerate", lambda: threads)
+    sampler = StackSampler(0.01)
+    sampler._stop = FakeStopEvent(samples=3)
+
+    sampler._run()
+
+    assert sampler.stacks == Counter(
+        {"ThreadPoolExecutor-0;_worker (thread.py:1);search (rag.py:2)": 3}
+    )
+
+
+def test_read_profile(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), 0.01)
+    path = profiler.save("abc", Counter({"main;rag": 2, "main;llm": 5}), 0.1)
+
+    assert profiler.read_profile(path.stem) == "main;llm 5\nmain;rag 2\n"
+    assert profiler.list_profiles() == [
+        {"name": path.stem, "size": path.stat().st_size}
+    ]
+    assert profiler.read_profile("missing") is None
+    # only files of the output directory are served
+    (tmp_path.parent / "secret.folded").write_text("secret")
+    assert profiler.read_profile("../secret") is None
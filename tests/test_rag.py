@@ -0,0 +1,223 @@
+import threading
+
+import pytest
+
+from recipe_assistant import llm_client, rag, relevance, routing, sessions
+
+RECIPE = {
+    "recipe_id": 1,
+    "recipe_name": "Ground Beef Gyros",
+    "recipe_link": "https://example.com/gyros",
+    "ready-in": "22 mins",
+    "text": "Recipe: Ground Beef Gyros | Ready in: 22 mins",
+}
+
+
+@pytest.fixture
+def llm_behaviour():
+    # models whose answers fail the local check, models that time out
+    return {"irrelevant": set(), "timeout": set()}
+
+
+@pytest.fixture
+def llm_calls(monkeypatch, llm_behaviour):
+    calls = []
+
+    def fake_llm(prompt, llm_model, timeout=None):
+        calls.append(llm_model)
+        if llm_model in llm_behaviour["timeout"]:
+            raise llm_client.LLMDeadlineExceeded(llm_model)
+        stats = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        return f"{llm_model}: it takes 22 minutes.", stats
+
+    def fake_local_relevance(question, answer, results, chunks_only=True):
+        model = answer.split(":")[0]
+        relevant = model not in llm_behaviour["irrelevant"]
+        return {
+            "Relevance": "RELEVANT" if relevant else "NON_RELEVANT",
+            "Explanation": "",
+            "score": 0.9 if relevant else 0.1,
+            "low_confidence": False,
+        }
+
+    monkeypatch.setattr(rag, "retrieve", lambda query, limit=5, timeout=None: [RECIPE])
+    monkeypatch.setattr(rag, "llm", fake_llm)
+    monkeypatch.setattr(relevance, "local_relevance", fake_local_relevance)
+    monkeypatch.setattr(relevance, "needs_llm_judge", lambda result: False)
+    monkeypatch.setattr(rag, "_answer_cache", type(rag._answer_cache)())
+    return calls
+
+
+def test_auto_requests_hit_the_answer_cache(llm_calls):
+    question = "How long do the Ground Beef Gyros take?"
+    answers = [rag.rag(question, llm_model=routing.AUTO_MODEL) for _ in range(3)]
+
+    assert llm_calls == [routing.ROUTING_CHEAP_MODEL]
+    assert [answer["cache_hit"] for answer in answers] == [False, True, True]
+    assert answers[2]["model_used"] == routing.ROUTING_CHEAP_MODEL
+
+
+SIMPLE_QUESTION = "How long do the Ground Beef Gyros take?"
+COMPLEX_QUESTION = (
+    "Which sides would you recommend with these gyros for a dinner party?"
+)
+
+
+def test_simple_question_goes_to_the_cheap_model(llm_calls):
+    answer = rag.rag(SIMPLE_QUESTION, llm_model=routing.AUTO_MODEL)
+
+    assert llm_calls == [routing.ROUTING_CHEAP_MODEL]
+    assert answer["routing_decision"] == "cheap:simple"
+
+
+def test_complex_question_goes_to_the_strong_model(llm_calls):
+    answer = rag.rag(COMPLEX_QUESTION, llm_model=routing.AUTO_MODEL)
+
+    assert llm_calls == [routing.ROUTING_STRONG_MODEL]
+    assert answer["routing_decision"] == "strong:complex"
+
+
+def test_irrelevant_cheap_answer_is_escalated(llm_calls, llm_behaviour):
+    llm_behaviour["irrelevant"].add(routing.ROUTING_CHEAP_MODEL)
+
+    answer = rag.rag(SIMPLE_QUESTION, llm_model=routing.AUTO_MODEL)
+
+    assert llm_calls == [routing.ROUTING_CHEAP_MODEL, routing.ROUTING_STRONG_MODEL]
+    assert answer["routing_decision"] == "escalated:simple"
+    assert answer["model_used"] == routing.ROUTING_STRONG_MODEL
+    # both calls are paid for
+    assert answer["total_tokens"] == 30
+    assert answer["relevance"] == "RELEVANT"
+
+
+def test_escalation_over_budget_keeps_the_cheap_answer(llm_calls, llm_behaviour):
+    llm_behaviour["irrelevant"].add(routing.ROUTING_CHEAP_MODEL)
+    # enough for the cheap model, not for the strong one
+    max_cost = 2 * rag.estimated_call_cost(routing.ROUTING_CHEAP_MODEL, "x" * 400)
+
+    answer = rag.rag(SIMPLE_QUESTION, llm_model=routing.AUTO_MODEL, max_cost=max_cost)
+
+    assert llm_calls == [routing.ROUTING_CHEAP_MODEL]
+    assert answer["routing_decision"] == "cheap:simple:escalation_over_budget"
+
+
+def test_escalation_timed_out_keeps_the_cheap_answer(llm_calls, llm_behaviour):
+    llm_behaviour["irrelevant"].add(routing.ROUTING_CHEAP_MODEL)
+    llm_behaviour["timeout"].add(routing.ROUTING_STRONG_MODEL)
+
+    answer = rag.rag(SIMPLE_QUESTION, llm_model=routing.AUTO_MODEL)
+
+    assert answer["routing_decision"] == "cheap:simple:escalation_timed_out"
+    assert answer["model_used"] == routing.ROUTING_CHEAP_MODEL
+
+
+def test_nothing_fits_the_cost_budget(llm_calls):
+    answer = rag.rag(COMPLEX_QUESTION, llm_model=routing.AUTO_MODEL, max_cost=1e-7)
+
+    assert llm_calls == []
+    assert answer["routing_decision"] == "fallback:over_budget"
+    assert answer["openai_cost"] == 0.0
+    assert answer["fallback"][0]["recipe_name"] == RECIPE["recipe_name"]
+
+
+@pytest.fixture
+def sparse_calls(monkeypatch):
+    calls = []
+
+    def fake_sparse_search(query, limit=5, timeout=None):
+        calls.append(timeout)
+        return [RECIPE]
+
+    monkeypatch.setattr(rag.ingest, "INDEX_MODE", "recipe")
+    monkeypatch.setattr(rag, "qdrant_sparse_search", fake_sparse_search)
+    return calls
+
+
+def test_slow_hybrid_search_falls_back_to_sparse(monkeypatch, sparse_calls):
+    release = threading.Event()
+    monkeypatch.setattr(
+        rag, "qdrant_rrf_search", lambda query, limit=5: release.wait(5) and []
+    )
+
+    assert rag.retrieve("gyros", timeout=0.2) == [RECIPE]
+    # Qdrant timeouts are whole seconds
+    assert sparse_calls == [1]
+    release.set()
+
+
+def test_saturated_search_runs_sparse_directly(monkeypatch, sparse_calls):
+    monkeypatch.setattr(rag, "_search_slots", threading.BoundedSemaphore(1))
+    rag._search_slots.acquire()
+    monkeypatch.setattr(
+        rag, "qdrant_rrf_search", lambda query, limit=5: pytest.fail("queued")
+    )
+
+    assert rag.retrieve("gyros", timeout=3.5) == [RECIPE]
+    assert sparse_calls == [4]
+
+
+def test_chunk_search_applies_the_search_profile(monkeypatch):
+    calls = []
+    monkeypatch.setitem(
+        rag.search_profiles,
+        "fast",
+        {"mode": "dense", "fusion": "dbsf", "prefetch_multiplier": 2},
+    )
+    monkeypatch.setattr(rag.embeddings, "dense_query_vector", lambda query: [0.1])
+    monkeypatch.setattr(rag.embeddings, "sparse_query_vector", lambda query: "bm25")
+    monkeypatch.setattr(
+        rag, "chunk_query_groups", lambda *args, **kwargs: calls.append((args, kwargs))
+    )
+
+    rag.qdrant_chunk_search("gyros", "chunks", search_profile="fast")
+    rag.qdrant_chunk_search("gyros", "chunks", sparse_only=True, search_profile="fast")
+
+    (dense_args, dense_kwargs), (sparse_args, sparse_kwargs) = calls
+    assert dense_args == ([0.1], None)
+    assert dense_kwargs["mode"] == "dense"
+    assert dense_kwargs["fusion"] == "dbsf"
+    assert dense_kwargs["prefetch_multiplier"] == 2
+    # the sparse fallback only needs the sparse embedding
+    assert sparse_args == (None, "bm25")
+    assert sparse_kwargs["mode"] == "sparse"
+
+
+def test_follow_up_fetches_the_conversation_recipes(monkeypatch, llm_calls):
+    fetched = []
+    searched = []
+    monkeypatch.setattr(sessions, "store", sessions.SessionStore())
+    monkeypatch.setattr(
+        rag,
+        "fetch_recipes",
+        lambda recipe_ids, timeout=None: fetched.append(recipe_ids) or [RECIPE],
+    )
+    monkeypatch.setattr(
+        rag,
+        "retrieve",
+        lambda query, limit=5, timeout=None: searched.append(query) or [RECIPE],
+    )
+
+    rag.rag(SIMPLE_QUESTION, conversation_id="conv-1")
+    rag.rag("Can I make it without beef?", conversation_id="conv-2", parent_id="conv-1")
+
+    assert searched == [SIMPLE_QUESTION]
+    assert fetched == [[RECIPE["recipe_id"]]]
+    assert len(sessions.store.get("conv-2")["history"]) == 2
+
+
+def test_follow_up_searches_when_its_recipes_are_gone(monkeypatch, llm_calls):
+    searched = []
+    monkeypatch.setattr(sessions, "store", sessions.SessionStore())
+    monkeypatch.setattr(rag, "fetch_recipes", lambda recipe_ids, timeout=None: [])
+    monkeypatch.setattr(
+        rag,
+        "retrieve",
+        lambda query, limit=5, timeout=None: searched.append(query) or [RECIPE],
+    )
+
+    rag.rag(SIMPLE_QUESTION, conversation_id="conv-1")
+    rag.rag("Can I make it without beef?", conversation_id="conv-2", parent_id="conv-1")
+
+    assert len(searched) == 2
+    # a new conversation
+    assert len(sessions.store.get("conv-2")["history"]) == 1
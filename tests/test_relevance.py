@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recipe_assistant import relevance
+
+THRESHOLDS = {
+    "similarity_weight": 0.5,
+    "partly_relevant": 0.4,
+    "relevant": 0.7,
+    "margin": 0.05,
+}
+
+
+def test_classify():
+    scores = np.array([0.1, 0.4, 0.69, 0.7, 0.95])
+    assert relevance.classify(scores, 0.4, 0.7).tolist() == [0, 1, 1, 2, 2]
+
+
+def test_macro_f1():
+    labels = np.array([0, 0, 1, 2, 2])
+    assert relevance.macro_f1(labels, labels) == 1.0
+    # NON_RELEVANT f1 2/3, PARTLY_RELEVANT 0 (never predicted), RELEVANT 1
+    predictions = np.array([0, 0, 0, 2, 2])
+    assert relevance.macro_f1(labels, predictions) == pytest.approx((0.8 + 0 + 1) / 3)
+
+
+@pytest.fixture
+def features(monkeypatch):
+    monkeypatch.setattr(relevance, "thresholds", THRESHOLDS)
+
+    def set_features(similarity, overlap):
+        monkeypatch.setattr(
+            relevance,
+            "relevance_features",
+            lambda questions, answers, contexts: (
+                np.array([similarity]),
+                np.array([overlap]),
+            ),
+        )
+
+    return set_features
+
+
+def test_local_relevance_labels_the_score(features):
+    features(0.9, 0.7)
+    result = relevance.local_relevance("q", "a", [{"text": "recipe"}])
+
+    assert result["Relevance"] == "RELEVANT"
+    assert result["score"] == pytest.approx(0.8)
+    assert not result["low_confidence"]
+
+
+def test_local_relevance_flags_scores_near_a_threshold(features):
+    features(0.5, 0.32)
+    result = relevance.local_relevance("q", "a", [{"text": "recipe"}])
+
+    assert result["Relevance"] == "PARTLY_RELEVANT"
+    assert result["low_confidence"]
+
+
+def test_every_answer_is_judged_until_calibrated(monkeypatch):
+    confident = {"low_confidence": False}
+    monkeypatch.setattr(relevance, "JUDGE_SAMPLE_RATE", 0.0)
+
+    monkeypatch.setattr(relevance, "calibrated", False)
+    assert relevance.needs_llm_judge(confident)
+    monkeypatch.setattr(relevance, "calibrated", True)
+    assert not relevance.needs_llm_judge(confident)
+    assert relevance.needs_llm_judge({"low_confidence": True})
+
+
+def labelled_scores():
+    # one band per label, the upper cutoffs are above the median score
+    labels = np.array([0] * 10 + [1] * 10 + [2] * 30)
+    scores = np.concatenate(
+        [
+            np.linspace(0.1, 0.3, 10),
+            np.linspace(0.5, 0.6, 10),
+            np.linspace(0.8, 0.9, 30),
+        ]
+    )
+    return scores, labels
+
+
+def test_fit_thresholds_separates_the_bands():
+    scores, labels = labelled_scores()
+
+    fitted = relevance.fit_thresholds(scores, scores, labels)
+
+    assert fitted["macro_f1"] == 1.0
+    assert 0.3 < fitted["partly_relevant"] <= 0.5
+    assert 0.6 < fitted["relevant"] <= 0.8
+    # no disagreement to keep away from the thresholds
+    assert fitted["margin"] == 0.0
+    assert fitted["judged_share"] == 0.0
+
+
+def test_calibrate_margin_covers_the_disagreements():
+    scores = np.array([0.1, 0.38, 0.42, 0.6, 0.9])
+    labels = np.array([0, 1, 0, 1, 2])
+
+    margin, judged_share = relevance.calibrate_margin(
+        scores, labels, 0.4, 0.7, target_agreement=1.0
+    )
+
+    assert margin == pytest.approx(0.025)
+    assert judged_share == pytest.approx(0.4)
+
+
+def test_calibrate_reads_the_judged_answers(monkeypatch, tmp_path):
+    scores, labels = labelled_scores()
+    path = tmp_path / "eval.csv"
+    pd.DataFrame(
+        {
+            "question": [f"q{i}" for i in range(len(labels))] + ["q"],
+            "answer": ["a"] * (len(labels) + 1),
+            "id": range(len(labels) + 1),
+            "relevance": [relevance.LABELS[label] for label in labels] + ["UNKNOWN"],
+        }
+    ).to_csv(path, index=False)
+    contexts = []
+    monkeypatch.setattr(
+        relevance,
+        "retrieved_contexts",
+        lambda questions, limit: contexts.extend(questions) or questions,
+    )
+    monkeypatch.setattr(
+        relevance,
+        "relevance_features",
+        lambda questions, answers, contexts: (scores, scores),
+    )
+
+    fitted = relevance.calibrate([path])
+
+    # the unknown verdict is left out
+    assert len(contexts) == len(labels)
+    assert fitted["macro_f1"] == 1.0
@@ -0,0 +1,79 @@
+from recipe_assistant import llm_client, rag, routing
+
+GYROS = [{"recipe_name": "Ground Beef Gyros"}]
+PROMPT = "x" * 400
+
+
+def test_is_simple_question():
+    assert routing.is_simple_question("How long do Ground Beef Gyros take?", GYROS)
+    # the question does not name the top recipe
+    assert not routing.is_simple_question("How long does it take?", GYROS)
+    assert not routing.is_simple_question("How long do gyros take?", [])
+    # asks for more than a fact of one recipe
+    assert not routing.is_simple_question(
+        "Which is healthier, Ground Beef Gyros or tacos?", GYROS
+    )
+    long_question = "Ground Beef Gyros " + "please " * routing.SIMPLE_MAX_WORDS
+    assert not routing.is_simple_question(long_question, GYROS)
+
+
+def test_should_escalate():
+    relevant = {"Relevance": "RELEVANT", "low_confidence": False}
+    assert not routing.should_escalate(relevant)
+    assert routing.should_escalate({**relevant, "low_confidence": True})
+    assert routing.should_escalate({**relevant, "Relevance": "PARTLY_RELEVANT"})
+
+
+def test_fits_budget_cost(monkeypatch):
+    cost = rag.estimated_call_cost(routing.ROUTING_CHEAP_MODEL, PROMPT)
+
+    assert rag.fits_budget(routing.ROUTING_CHEAP_MODEL, PROMPT, None, None)
+    assert rag.fits_budget(routing.ROUTING_CHEAP_MODEL, PROMPT, None, cost)
+    assert not rag.fits_budget(routing.ROUTING_CHEAP_MODEL, PROMPT, None, cost / 2)
+    # a model with no known price never fits a cost budget
+    assert not rag.fits_budget("unknown-model", PROMPT, None, 100.0)
+
+
+def test_fits_budget_latency(monkeypatch):
+    latencies = {}
+    monkeypatch.setattr(
+        llm_client, "latency_quantile", lambda model, q: latencies.get(model)
+    )
+    monkeypatch.setattr(routing, "ROUTING_DEFAULT_LATENCY", 5.0)
+
+    # no recent call, the default latency is used
+    assert not rag.fits_budget(routing.ROUTING_STRONG_MODEL, PROMPT, 4.0, None)
+    assert rag.fits_budget(routing.ROUTING_STRONG_MODEL, PROMPT, 6.0, None)
+
+    latencies[routing.ROUTING_STRONG_MODEL] = 2.0
+    assert rag.fits_budget(routing.ROUTING_STRONG_MODEL, PROMPT, 4.0, None)
+    assert not rag.fits_budget(routing.ROUTING_STRONG_MODEL, PROMPT, 1.0, None)
+
+
+def test_route_model(monkeypatch):
+    monkeypatch.setattr(llm_client, "latency_quantile", lambda model, q: 2.0)
+    simple = "How long do Ground Beef Gyros take?"
+    complex_ = "Which sides would you recommend with Ground Beef Gyros?"
+    cheap_cost = rag.estimated_call_cost(routing.ROUTING_CHEAP_MODEL, PROMPT)
+    strong_cost = rag.estimated_call_cost(routing.ROUTING_STRONG_MODEL, PROMPT)
+
+    def route(question, remaining_time=None, remaining_cost=None):
+        return rag.route_model(question, GYROS, PROMPT, remaining_time, remaining_cost)
+
+    assert route(simple) == (routing.ROUTING_CHEAP_MODEL, "cheap:simple")
+    assert route(complex_) == (routing.ROUTING_STRONG_MODEL, "strong:complex")
+    # the strong model is too slow or too expensive
+    assert route(complex_, remaining_time=1.0) == (
+        routing.ROUTING_CHEAP_MODEL,
+        "cheap:over_budget",
+    )
+    assert route(complex_, remaining_cost=cheap_cost) == (
+        routing.ROUTING_CHEAP_MODEL,
+        "cheap:over_budget",
+    )
+    assert route(complex_, remaining_cost=strong_cost)[1] == "strong:complex"
+    # not even the cheap model fits
+    for question in (simple, complex_):
+        assert route(question, remaining_cost=cheap_cost / 2)[1] == (
+            "fallback:over_budget"
+        )
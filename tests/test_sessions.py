@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+from recipe_assistant import clients, embeddings, ingest, rag, sessions
+
+GYROS = {"recipe_id": 1, "recipe_name": "Ground Beef Gyros"}
+
+
+def test_session_expires_after_its_ttl(clock):
+    store = sessions.SessionStore(ttl=60, max_size=10)
+    store.put("conv-1", {"history": []})
+
+    clock[0] += 59
+    assert store.get("conv-1") is not None
+    clock[0] += 2
+    assert store.get("conv-1") is None
+    assert len(store) == 0
+
+
+def test_put_evicts_the_oldest_sessions(clock):
+    store = sessions.SessionStore(ttl=60, max_size=2)
+    for conversation_id in ("conv-1", "conv-2", "conv-3"):
+        store.put(conversation_id, {"history": []})
+        clock[0] += 1
+
+    assert store.get("conv-1") is None
+    assert store.get("conv-2") is not None
+    assert len(store) == 2
+
+
+def test_put_drops_expired_sessions(clock):
+    store = sessions.SessionStore(ttl=60, max_size=10)
+    store.put("conv-1", {"history": []})
+    clock[0] += 61
+    store.put("conv-2", {"history": []})
+
+    assert len(store) == 1
+
+
+@pytest.fixture
+def session():
+    return sessions.new_session("quick beef dinner", "Try the gyros.", [GYROS])
+
+
+def test_session_keeps_only_the_recipe_ids_and_names(session):
+    assert session["recipe_ids"] == [1]
+    assert session["recipe_names"] == ["Ground Beef Gyros"]
+    assert "search_results" not in session
+
+
+def test_follow_up_marker_stays_on_topic(session):
+    assert not sessions.topic_changed("Can I make it without beef?", session)
+
+
+def test_recipe_name_stays_on_topic(session):
+    assert not sessions.topic_changed("How spicy are the gyros?", session)
+
+
+def test_unrelated_question_changes_topic(monkeypatch, session):
+    monkeypatch.setattr(embeddings, "embed_texts", lambda texts: np.array([[1.0, 0.0]]))
+    monkeypatch.setattr(embeddings, "dense_query_vector", lambda query: [0.0, 1.0])
+
+    assert sessions.topic_changed("Any vegan desserts with berries?", session)
+    # the topic is embedded once per conversation
+    assert session["topic_vector"].tolist() == [1.0, 0.0]
+
+
+def test_similar_question_stays_on_topic(monkeypatch, session):
+    monkeypatch.setattr(embeddings, "embed_texts", lambda texts: np.array([[1.0, 0.0]]))
+    monkeypatch.setattr(embeddings, "dense_query_vector", lambda query: [0.9, 0.1])
+
+    assert not sessions.topic_changed("Something warm for a rainy evening?", session)
+
+
+@pytest.mark.parametrize("mode", ["recipe", "chunked"])
+def test_fetch_recipes_by_id(monkeypatch, mode):
+    qdrant_client = QdrantClient(":memory:")
+    qdrant_client.create_collection(
+        "recipes", vectors_config=models.VectorParams(size=2, distance="Cosine")
+    )
+    if mode == "chunked":
+        # point ids as in ingest.prepare_recipe_chunks
+        payloads = {
+            1 * len(ingest.CHUNK_FIELDS) + i: {**GYROS, "field": field}
+            for i, field in enumerate(ingest.CHUNK_FIELDS)
+        }
+    else:
+        payloads = {1: GYROS}
+    qdrant_client.upsert(
+        "recipes",
+        points=[
+            models.PointStruct(id=point_id, vector=[1.0, 0.0], payload=payload)
+            for point_id, payload in payloads.items()
+        ],
+    )
+    monkeypatch.setattr(clients, "get_qdrant_client", lambda: qdrant_client)
+
+    recipes = rag.fetch_recipes([1, 99], "recipes", mode=mode)
+
+    # recipes gone from the index are skipped, chunk fields dropped
+    assert recipes == [GYROS]
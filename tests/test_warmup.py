@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from recipe_assistant import embeddings, rag, warmup
+
+
+@pytest.fixture
+def questions_csv(tmp_path):
+    path = tmp_path / "questions.csv"
+    pd.DataFrame(
+        {
+            "id": [1, 2, 3, 4],
+            "question": [" Quick gyros? ", "Quick gyros?", "", "Vegan chili?"],
+        }
+    ).to_csv(path, index=False)
+    return path
+
+
+def test_load_questions_deduplicates_the_csv(questions_csv):
+    assert warmup.load_questions("csv", path=questions_csv) == [
+        "Quick gyros?",
+        "Vegan chili?",
+    ]
+    assert warmup.load_questions("csv", top_n=1, path=questions_csv) == ["Quick gyros?"]
+
+
+def test_load_questions_from_the_conversations(monkeypatch):
+    monkeypatch.setattr(
+        warmup, "get_top_questions", lambda limit: ["Vegan chili?", "Quick gyros?"]
+    )
+    assert warmup.load_questions("conversations", top_n=1) == ["Vegan chili?"]
+
+
+def test_load_questions_without_questions_fails(monkeypatch):
+    monkeypatch.setattr(warmup, "get_top_questions", lambda limit: [])
+    with pytest.raises(ValueError):
+        warmup.load_questions("conversations")
+    with pytest.raises(ValueError):
+        warmup.load_questions("unknown")
+
+
+def test_warm_up_answers_every_question(monkeypatch):
+    answered = []
+
+    def fake_rag(question, llm_model, limit):
+        if question == "broken":
+            raise RuntimeError("no answer")
+        answered.append((question, llm_model, limit))
+
+    monkeypatch.setattr(embeddings, "get_dense_model", lambda: None)
+    monkeypatch.setattr(embeddings, "get_sparse_model", lambda: None)
+    monkeypatch.setattr(rag, "rag", fake_rag)
+
+    stats = warmup.warm_up(["gyros", "broken", "chili"], llm_model="gpt-4o-mini")
+
+    assert sorted(answered) == [
+        ("chili", "gpt-4o-mini", 5),
+        ("gyros", "gpt-4o-mini", 5),
+    ]
+    assert (stats["questions"], stats["answered"], stats["failed"]) == (3, 2, 1)